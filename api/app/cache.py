@@ -0,0 +1,223 @@
+"""
+プロセス内で共有するエンティティのキャッシュ
+
+登録後はほとんど変わらない会議・発言・国会回次を、リクエストをまたいでメモリに保持する。
+件数ではなくおおよそのバイト数で上限を決め、古いものから追い出す (LRU)。
+スクレイパーが訂正を書き込むとkokkai_db.invalidationのNOTIFYが送られるので、
+listen_for_invalidationで受け取って該当するキーを取り除く。
+LISTENできていない間はキャッシュを使わない。
+"""
+
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Iterable, List, Optional
+
+import psycopg
+from sqlalchemy import Row
+from sqlalchemy.engine import make_url
+
+from kokkai_db.invalidation import (
+    INVALIDATION_CHANNEL,
+    MEETINGS,
+    SESSIONS,
+    SPEECHES,
+    parse_invalidation,
+)
+
+_MISSING = object()
+
+# 国会回次の一覧をまとめて保持するキー (いずれかの国会回次の無効化で取り除く)
+ALL_SESSIONS = "all"
+
+
+def estimate_size(value) -> int:
+    """値のおおよそのメモリ使用量 (バイト)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, (Row, list, tuple)):
+        size += sum(estimate_size(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return size
+
+
+class EntityCache:
+    """
+    バイト数の上限とTTLを持つLRUキャッシュ
+    groupはキーから無効化の単位(issue_idなど)を取り出す関数
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int,
+        ttl: float,
+        group: Optional[Callable[[Hashable], Hashable]] = None,
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.group = group or (lambda key: key)
+        self.enabled = False
+        # 無効化のたびに増やし、読み込み中に無効化された結果を保存しないようにする
+        self.generation = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key) if self.enabled else None
+        if entry is None:
+            self.misses += 1
+            return default
+        value, size, expires_at = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, generation: Optional[int] = None):
+        if not self.enabled:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        size = estimate_size(key) + estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, time.monotonic() + self.ttl)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, groups: Iterable[Hashable]) -> int:
+        """groupsに含まれるキーを取り除き、取り除いた件数を返す"""
+        groups = set(groups)
+        self.generation += 1
+        keys = [key for key in self._entries if self.group(key) in groups]
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+
+class EntityCaches:
+    """
+    DataLoadersの下に置くキャッシュ一式
+    上限のバイト数を会議・発言・国会回次で分ける
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.meetings = EntityCache(MEETINGS, max_bytes // 4, ttl)
+        # 発言のキーは(issue_id, 絞り込み条件)なので、issue_id単位で無効化する
+        self.speeches = EntityCache(
+            SPEECHES, max_bytes * 7 // 10, ttl, group=lambda key: key[0]
+        )
+        self.sessions = EntityCache(SESSIONS, max_bytes // 20, ttl)
+        self._by_kind = {
+            cache.name: cache for cache in (self.meetings, self.speeches, self.sessions)
+        }
+
+    def set_enabled(self, enabled: bool):
+        """LISTENの開始・切断に合わせて切り替える (切り替え時は中身を捨てる)"""
+        for cache in self._by_kind.values():
+            cache.clear()
+            cache.enabled = enabled
+
+    def invalidate(self, kind: str, keys: Iterable[Hashable]) -> int:
+        cache = self._by_kind.get(kind)
+        if cache is None:
+            return 0
+        if cache is self.sessions:
+            keys = [*keys, ALL_SESSIONS]
+        return cache.invalidate(keys)
+
+    def stats(self) -> dict:
+        return {name: cache.stats() for name, cache in self._by_kind.items()}
+
+
+async def load_through(
+    cache: Optional[EntityCache],
+    keys: List[Hashable],
+    load: Callable[[List[Hashable]], Awaitable[list]],
+) -> list:
+    """キャッシュにないキーだけをloadで取得し、取得した結果をキャッシュに入れる"""
+    if cache is None or not cache.enabled:
+        return await load(keys)
+    results = {}
+    missing = []
+    for key in keys:
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            missing.append(key)
+        else:
+            results[key] = value
+    if missing:
+        generation = cache.generation
+        for key, value in zip(missing, await load(missing)):
+            results[key] = value
+            cache.put(key, value, generation)
+    return [results[key] for key in keys]
+
+
+async def listen_for_invalidation(
+    database_url: str, caches: EntityCaches, retry_interval: float = 5.0
+):
+    """
+    スクレイパーからの無効化の通知をLISTENで受け取り、キャッシュから取り除く
+    接続が切れている間の通知は受け取れないため、その間はキャッシュを止めておく
+    PgBouncerのトランザクションプーリングではLISTENできないため、直接接続のURLを渡す
+    """
+    conninfo = (
+        make_url(database_url)
+        .set(drivername="postgresql")
+        .render_as_string(hide_password=False)
+    )
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                conninfo, autocommit=True
+            ) as connection:
+                await connection.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+                caches.set_enabled(True)
+                async for notify in connection.notifies():
+                    kind, keys = parse_invalidation(notify.payload)
+                    caches.invalidate(kind, keys)
+        except asyncio.CancelledError:
+            caches.set_enabled(False)
+            raise
+        except Exception as e:
+            print(f"Cache invalidation listener disconnected: {e}")
+        caches.set_enabled(False)
+        await asyncio.sleep(retry_interval)
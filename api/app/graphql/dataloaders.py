@@ -1,89 +1,230 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from collections import defaultdict
+from dataclasses import dataclass
 
 from strawberry.dataloader import DataLoader
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import Row, Select, select, and_, func
 
-from kokkai_db.schema import Meeting, Speech, Summary, Session
+from kokkai_db.schema import (
+    LatestSummary,
+    Meeting,
+    Speech,
+    SpeechBody,
+    Summary,
+    Session,
+)
+from ..cache import EntityCaches, load_through
+
+
+def _meetings_by_issue_ids_query(issue_ids: List[str]) -> Select:
+    return select(*Meeting.__table__.columns).where(Meeting.issue_id.in_(issue_ids))
 
 
 async def load_meetings_by_issue_ids(
     session: AsyncSession, issue_ids: List[str]
-) -> List[List[Optional[Meeting]]]:
-    meetings = await session.execute(
-        select(Meeting).where(Meeting.issue_id.in_(issue_ids))
+) -> List[Optional[Row]]:
+    meetings = await session.execute(_meetings_by_issue_ids_query(issue_ids))
+    meetings_by_id = {meeting.issue_id: meeting for meeting in meetings.all()}
+    return [meetings_by_id.get(issue_id) for issue_id in issue_ids]
+
+
+@dataclass(frozen=True)
+class SpeechFilter:
+    """Meeting.speechesの絞り込み条件 (DataLoaderのキーに使うため不変にする)"""
+
+    speech_id: Optional[str] = None
+    speaker: Optional[str] = None
+    speaker_group: Optional[str] = None
+    from_order: Optional[int] = None
+    limit: Optional[int] = None
+
+    def conditions(self) -> list:
+        conditions = []
+        if self.speech_id:
+            conditions.append(Speech.speech_id == self.speech_id)
+        if self.speaker:
+            conditions.append(Speech.speaker == self.speaker)
+        if self.speaker_group:
+            conditions.append(Speech.speaker_group == self.speaker_group)
+        if self.from_order is not None:
+            conditions.append(Speech.speech_order >= self.from_order)
+        return conditions
+
+
+def _speeches_query(
+    session_number: int, issue_ids: List[str], speech_filter: SpeechFilter
+) -> Select:
+    """
+    国会回次の会議の発言を(issue_id, 発言順)で取得するSELECT文
+    国会回次の条件でspeechesのパーティションを1つに絞る
+    """
+    columns = Speech.__table__.columns
+    conditions = [
+        Speech.session == session_number,
+        Speech.issue_id.in_(issue_ids),
+        *speech_filter.conditions(),
+    ]
+    if speech_filter.limit is None or len(issue_ids) == 1:
+        return (
+            select(*columns)
+            .where(*conditions)
+            .order_by(Speech.issue_id, Speech.speech_order)
+            .limit(speech_filter.limit)
+        )
+    # 複数の会議をまとめて取得する場合は会議ごとに先頭limit件に絞る
+    ranked = (
+        select(
+            *columns,
+            func.row_number()
+            .over(partition_by=Speech.issue_id, order_by=Speech.speech_order)
+            .label("rn"),
+        )
+        .where(*conditions)
+        .subquery()
+    )
+    return (
+        select(*(ranked.c[column.name] for column in columns))
+        .where(ranked.c.rn <= speech_filter.limit)
+        .order_by(ranked.c.issue_id, ranked.c.speech_order)
     )
-    meetings_by_id = {meeting.issue_id: meeting for meeting in meetings.scalars().all()}
-    return [[meetings_by_id.get(issue_id)] for issue_id in issue_ids]
 
 
 async def load_speeches_by_issue_ids(
-    session: AsyncSession, issue_ids: List[str]
-) -> List[List[Speech]]:
-    speeches = await session.execute(
-        select(Speech).where(Speech.issue_id.in_(issue_ids))
+    session: AsyncSession, keys: List[Tuple[str, int, SpeechFilter]]
+) -> List[List[Row]]:
+    """
+    (issue_id, 国会回次, 絞り込み条件)ごとの発言を発言順に取得する
+    同じ国会回次・条件のキーは1つのSELECT文にまとめ、条件と件数の制限はSQLで行う
+    ORMのエンティティにはせず、列の値だけを持つRowを返す
+    """
+    issue_ids_by_filter = defaultdict(list)
+    for issue_id, session_number, speech_filter in keys:
+        issue_ids_by_filter[(session_number, speech_filter)].append(issue_id)
+
+    speeches_by_key = defaultdict(list)
+    for (session_number, speech_filter), issue_ids in issue_ids_by_filter.items():
+        stmt = _speeches_query(session_number, issue_ids, speech_filter)
+        for speech in (await session.execute(stmt)).all():
+            speeches_by_key[(speech.issue_id, session_number, speech_filter)].append(
+                speech
+            )
+    return [speeches_by_key[key] for key in keys]
+
+
+def _speech_bodies_query(session_number: int, speech_ids: List[str]) -> Select:
+    return select(SpeechBody.speech_id, SpeechBody.speech).where(
+        SpeechBody.session == session_number,
+        SpeechBody.speech_id.in_(speech_ids),
     )
-    speeches_by_issue_id = defaultdict(list)
-    for speech in speeches.scalars().all():
-        speeches_by_issue_id[speech.issue_id].append(speech)
-    return [speeches_by_issue_id[issue_id] for issue_id in issue_ids]
 
 
-async def load_latest_summaries_by_issue_ids(
-    session: AsyncSession, issue_ids: List[str]
-) -> List[Optional[Summary]]:
-    stmt = (
-        select(
-            Summary,
-            func.row_number()
-            .over(
-                partition_by=Summary.issue_id,
-                order_by=(Summary.update_time.desc(), Summary.prompt_version.desc()),
-            )
-            .label("rn"),
+async def load_speech_bodies_by_speech_ids(
+    session: AsyncSession, keys: List[Tuple[str, int]]
+) -> List[Optional[str]]:
+    """(speech_id, 国会回次)ごとの本文を、国会回次ごとに1つのSELECT文で取得する"""
+    speech_ids_by_session = defaultdict(list)
+    for speech_id, session_number in keys:
+        speech_ids_by_session[session_number].append(speech_id)
+
+    bodies_by_key = {}
+    for session_number, speech_ids in speech_ids_by_session.items():
+        bodies = await session.execute(_speech_bodies_query(session_number, speech_ids))
+        for speech_id, speech in bodies.all():
+            bodies_by_key[(speech_id, session_number)] = speech
+    return [bodies_by_key.get(key) for key in keys]
+
+
+def _latest_summaries_query(issue_ids: List[str]) -> Select:
+    return (
+        select(*Summary.__table__.columns)
+        .join(
+            LatestSummary,
+            and_(
+                Summary.issue_id == LatestSummary.issue_id,
+                Summary.model == LatestSummary.model,
+                Summary.prompt_version == LatestSummary.prompt_version,
+            ),
         )
-        .where(Summary.issue_id.in_(issue_ids))
-        .subquery()
+        .where(LatestSummary.issue_id.in_(issue_ids))
     )
 
-    summaries = await session.execute(select(Summary).where(stmt.c.rn == 1))
 
-    summaries_by_issue_id = {
-        summary.issue_id: summary for summary in summaries.scalars().all()
-    }
+async def load_latest_summaries_by_issue_ids(
+    session: AsyncSession, issue_ids: List[str]
+) -> List[Optional[Row]]:
+    summaries = await session.execute(_latest_summaries_query(issue_ids))
+
+    summaries_by_issue_id = {summary.issue_id: summary for summary in summaries.all()}
     return [summaries_by_issue_id.get(issue_id) for issue_id in issue_ids]
 
 
 async def load_sessions_by_session_numbers(
     session: AsyncSession, session_numbers: List[int]
-) -> List[Optional[Session]]:
+) -> List[Optional[Row]]:
     sessions = await session.execute(
-        select(Session)
+        select(*Session.__table__.columns)
         .where(Session.session.in_(session_numbers))
         .order_by(Session.session)
     )
-    sessions_by_number = {s.session: s for s in sessions.scalars().all()}
+    sessions_by_number = {s.session: s for s in sessions.all()}
     return [
         sessions_by_number.get(session_number) for session_number in session_numbers
     ]
 
 
+async def load_all_sessions(session: AsyncSession) -> List[Row]:
+    """全ての国会回次を新しい順に取得する"""
+    sessions = await session.execute(
+        select(*Session.__table__.columns).order_by(Session.session.desc())
+    )
+    return sessions.all()
+
+
 class DataLoaders:
-    def __init__(self, session: AsyncSession):
+    """
+    リクエストごとのDataLoader
+    cachesを渡した場合、会議・発言・国会回次はプロセス内のキャッシュを先に参照する
+    """
+
+    def __init__(self, session: AsyncSession, caches: Optional[EntityCaches] = None):
         async def _load_meetings(keys: List[str]):
-            return await load_meetings_by_issue_ids(session, keys)
+            return await load_through(
+                caches and caches.meetings,
+                keys,
+                lambda missing: load_meetings_by_issue_ids(session, missing),
+            )
+
+        async def _load_speeches(keys: List[Tuple[str, int, SpeechFilter]]):
+            return await load_through(
+                caches and caches.speeches,
+                keys,
+                lambda missing: load_speeches_by_issue_ids(session, missing),
+            )
 
-        async def _load_speeches(keys: List[str]):
-            return await load_speeches_by_issue_ids(session, keys)
+        async def _load_speech_bodies(keys: List[Tuple[str, int]]):
+            return await load_speech_bodies_by_speech_ids(session, keys)
 
         async def _load_summaries(keys: List[str]):
             return await load_latest_summaries_by_issue_ids(session, keys)
 
         async def _load_sessions(keys: List[int]):
-            return await load_sessions_by_session_numbers(session, keys)
+            return await load_through(
+                caches and caches.sessions,
+                keys,
+                lambda missing: load_sessions_by_session_numbers(session, missing),
+            )
+
+        async def _load_all_sessions(keys: List[str]):
+            # キーはALL_SESSIONSのみ (国会回次の一覧をまとめてキャッシュする)
+            async def _load(missing: List[str]):
+                return [await load_all_sessions(session) for _ in missing]
+
+            return await load_through(caches and caches.sessions, keys, _load)
 
         self.meetings_by_issue_id = DataLoader(_load_meetings)
         self.speeches_by_issue_id = DataLoader(_load_speeches)
+        self.speech_bodies_by_speech_id = DataLoader(_load_speech_bodies)
         self.latest_summaries_by_issue_id = DataLoader(_load_summaries)
         self.sessions_by_session_number = DataLoader(_load_sessions)
+        self.all_sessions = DataLoader(_load_all_sessions)
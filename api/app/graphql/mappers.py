@@ -0,0 +1,80 @@
+from operator import attrgetter
+from typing import Callable, Dict, Iterable, Optional
+
+
+def isoformat(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+class RowMapper:
+    """
+    SQLAlchemy CoreのRowをGraphQLの型に変換する
+    ORMのエンティティを経由せず、列の取り出し方をあらかじめ作っておいて行ごとの処理を減らす
+    """
+
+    def __init__(
+        self,
+        cls,
+        fields: Iterable[str],
+        prefix: str = "",
+        converters: Optional[Dict[str, Callable]] = None,
+    ):
+        self.cls = cls
+        self.fields = tuple(fields)
+        self.getter = attrgetter(*(prefix + field for field in self.fields))
+        converters = converters or {}
+        self.converters = tuple(
+            (i, converters[field])
+            for i, field in enumerate(self.fields)
+            if field in converters
+        )
+
+    def __call__(self, row, **extra):
+        values = self.getter(row)
+        if len(self.fields) == 1:
+            values = (values,)
+        if self.converters:
+            values = list(values)
+            for i, convert in self.converters:
+                values[i] = convert(values[i])
+        return self.cls(**dict(zip(self.fields, values)), **extra)
+
+
+# GraphQLの型のフィールドのうち、テーブルの列と同じ名前で取得するもの
+MEETING_FIELDS = (
+    "issue_id",
+    "image_kind",
+    "search_object",
+    "session",
+    "name_of_house",
+    "name_of_meeting",
+    "issue",
+    "date",
+    "closing",
+    "meeting_url",
+    "pdf_url",
+    "speech_count",
+    "total_chars",
+    "speaker_count",
+    "first_speech_order",
+    "last_speech_order",
+)
+SPEECH_FIELDS = (
+    "speech_id",
+    "session",
+    "speech_order",
+    "speaker",
+    "speaker_yomi",
+    "speaker_group",
+    "speaker_position",
+    "speaker_role",
+    "start_page",
+    "create_time",
+    "update_time",
+    "speech_url",
+)
+SUMMARY_FIELDS = ("summary", "model", "prompt_version", "create_time", "update_time")
+SESSION_FIELDS = ("session", "name", "start_date", "end_date")
+
+# Meetingと結合して取得する要約の列の接頭辞 (列名の重複を避ける)
+SUMMARY_PREFIX = "summary_"
@@ -0,0 +1,70 @@
+import base64
+import json
+from typing import Generic, List, Optional, Sequence, TypeVar
+
+import strawberry
+
+# 1ページで返す件数の既定値と上限
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+T = TypeVar("T")
+
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: Optional[str]
+
+
+@strawberry.type
+class Edge(Generic[T]):
+    cursor: str
+    node: T
+
+
+@strawberry.type
+class Connection(Generic[T]):
+    edges: List[Edge[T]]
+    page_info: PageInfo
+
+
+def encode_cursor(key: Sequence) -> str:
+    """並び順のキーの値をカーソル文字列にする"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: str, length: int) -> list:
+    """カーソル文字列を並び順のキーの値に戻す"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(key, list) or len(key) != length:
+        raise ValueError("Invalid cursor.")
+    return key
+
+
+def page_size(first: Optional[int]) -> int:
+    if first is None:
+        return DEFAULT_PAGE_SIZE
+    if first < 1 or first > MAX_PAGE_SIZE:
+        raise ValueError(f"'first' must be between 1 and {MAX_PAGE_SIZE}.")
+    return first
+
+
+def build_connection(rows: list, first: int, node, key) -> Connection:
+    """
+    first + 1件取得した結果から1ページ分のConnectionを作る
+    node: 行をGraphQLの型に変換する関数、key: 行から並び順のキーを取り出す関数
+    """
+    has_next_page = len(rows) > first
+    rows = rows[:first]
+    edges = [Edge(cursor=encode_cursor(key(row)), node=node(row)) for row in rows]
+    return Connection(
+        edges=edges,
+        page_info=PageInfo(
+            has_next_page=has_next_page,
+            end_cursor=edges[-1].cursor if edges else None,
+        ),
+    )
@@ -4,16 +4,33 @@ from datetime import date
 import strawberry
 from strawberry.types import Info
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, distinct, func
-from sqlalchemy.orm import aliased
+from sqlalchemy import select, and_, null, tuple_
 
 from kokkai_db.schema import (
+    LatestSummary as DBLatestSummary,
     Meeting as DBMeeting,
     Speech as DBSpeech,
-    Session as DBSession,
     Summary as DBSummary,
 )
-from .dataloaders import DataLoaders
+from ..cache import ALL_SESSIONS
+from .dataloaders import DataLoaders, SpeechFilter
+from .mappers import (
+    MEETING_FIELDS,
+    SESSION_FIELDS,
+    SPEECH_FIELDS,
+    SUMMARY_FIELDS,
+    SUMMARY_PREFIX,
+    RowMapper,
+    isoformat,
+)
+from .pagination import (
+    MAX_PAGE_SIZE,
+    Connection,
+    build_connection,
+    decode_cursor,
+    page_size,
+)
+from .selection import is_selected
 
 
 @strawberry.type
@@ -27,18 +44,29 @@ class Session:
 @strawberry.type
 class Speech:
     speech_id: str
+    session: int
     speech_order: int
     speaker: Optional[str]
     speaker_yomi: Optional[str]
     speaker_group: Optional[str]
     speaker_position: Optional[str]
     speaker_role: Optional[str]
-    speech: Optional[str]
     start_page: Optional[int]
     create_time: Optional[str]
     update_time: Optional[str]
     speech_url: str
 
+    @strawberry.field
+    async def speech(self, info) -> Optional[str]:
+        """
+        発言の本文
+        要求された場合のみspeech_bodiesから取得する
+        """
+        dataloaders: DataLoaders = info.context["dataloaders"]
+        return await dataloaders.speech_bodies_by_speech_id.load(
+            (self.speech_id, self.session)
+        )
+
 
 @strawberry.type
 class Summary:
@@ -62,34 +90,41 @@ class Meeting:
     closing: Optional[str]
     meeting_url: str
     pdf_url: Optional[str]
+    speech_count: int
+    total_chars: int
+    speaker_count: int
+    first_speech_order: Optional[int]
+    last_speech_order: Optional[int]
 
     @strawberry.field
-    async def speeches(self, info, speech_id: Optional[str] = None) -> List[Speech]:
+    async def speeches(
+        self,
+        info,
+        speech_id: Optional[str] = None,
+        speaker: Optional[str] = None,
+        speaker_group: Optional[str] = None,
+        from_order: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Speech]:
         """
-        Meetingに紐づくSpeechを取得する
+        Meetingに紐づくSpeechを発言順に取得する
+        from_order以降の発言をlimit件まで返す (絞り込みはSQLで行う)
         現在呼び出していない
         """
+        if limit is not None and limit < 1:
+            raise ValueError("'limit' must be 1 or greater.")
         dataloaders: DataLoaders = info.context["dataloaders"]
-        speeches = await dataloaders.speeches_by_issue_id.load(self.issue_id)
-        if speech_id:
-            return [Speech(**s.__dict__) for s in speeches if s.speech_id == speech_id]
-        return [
-            Speech(
-                speech_id=s.speech_id,
-                speech_order=s.speech_order,
-                speaker=s.speaker,
-                speaker_yomi=s.speaker_yomi,
-                speaker_group=s.speaker_group,
-                speaker_position=s.speaker_position,
-                speaker_role=s.speaker_role,
-                speech=s.speech,
-                start_page=s.start_page,
-                create_time=s.create_time.isoformat() if s.create_time else None,
-                update_time=s.update_time.isoformat() if s.update_time else None,
-                speech_url=s.speech_url,
-            )
-            for s in speeches
-        ]
+        speech_filter = SpeechFilter(
+            speech_id=speech_id,
+            speaker=speaker,
+            speaker_group=speaker_group,
+            from_order=from_order,
+            limit=limit,
+        )
+        speeches = await dataloaders.speeches_by_issue_id.load(
+            (self.issue_id, self.session, speech_filter)
+        )
+        return [speech_from_row(s) for s in speeches]
 
     summary: Optional[Summary]
 
@@ -100,19 +135,142 @@ class Meeting:
         現在呼び出していない
         """
         dataloaders: DataLoaders = info.context["dataloaders"]
-        session_info: Optional[
-            DBSession
-        ] = await dataloaders.sessions_by_session_number.load(self.session)
+        session_info = await dataloaders.sessions_by_session_number.load(self.session)
         if session_info:
-            return Session(
-                session=session_info.session,
-                name=session_info.name,
-                start_date=session_info.start_date,
-                end_date=session_info.end_date,
-            )
+            return session_from_row(session_info)
         return None
 
 
+# 取得したRowから各型への変換 (列の取り出し方は起動時に一度だけ作る)
+_TIME_CONVERTERS = {"create_time": isoformat, "update_time": isoformat}
+speech_from_row = RowMapper(Speech, SPEECH_FIELDS, converters=_TIME_CONVERTERS)
+summary_from_row = RowMapper(
+    Summary, SUMMARY_FIELDS, prefix=SUMMARY_PREFIX, converters=_TIME_CONVERTERS
+)
+# DataLoaderで取得したsummariesの行 (接頭辞なし)
+latest_summary_from_row = RowMapper(
+    Summary, SUMMARY_FIELDS, converters=_TIME_CONVERTERS
+)
+session_from_row = RowMapper(Session, SESSION_FIELDS)
+_meeting_from_row = RowMapper(Meeting, MEETING_FIELDS)
+
+
+def meeting_from_row(row) -> Meeting:
+    """_meetings_queryの1行をMeetingにする (要約のmodelがNULLなら要約なし)"""
+    summary = None
+    if getattr(row, SUMMARY_PREFIX + "model") is not None:
+        summary = summary_from_row(row)
+    return _meeting_from_row(row, summary=summary)
+
+
+_MEETING_COLUMNS = [DBMeeting.__table__.c[field] for field in MEETING_FIELDS]
+_SPEECH_COLUMNS = [
+    DBSpeech.__table__.c[field] for field in ("issue_id", *SPEECH_FIELDS)
+]
+
+
+def _meetings_query(
+    session: Optional[int] = None,
+    issue_id: Optional[str] = None,
+    name_of_house: Optional[str] = None,
+    name_of_meeting: Optional[str] = None,
+    has_summary: Optional[bool] = False,
+    with_summary: bool = True,
+    with_summary_text: bool = True,
+):
+    """
+    Meetingと最新の要約の列を取得するSELECT文 (issue_id順)
+    要約の列はSUMMARY_PREFIXを付けた名前で取得する
+    with_summaryがFalseの場合は要約を結合せず、要約の列は常にNULLになる
+    with_summary_textがFalseの場合は要約の本文を読み込まない
+    """
+    conditions = []
+    if session:
+        conditions.append(DBMeeting.session == session)
+    if issue_id:
+        conditions.append(DBMeeting.issue_id == issue_id)
+    if name_of_house:
+        conditions.append(DBMeeting.name_of_house == name_of_house)
+    if name_of_meeting:
+        conditions.append(DBMeeting.name_of_meeting == name_of_meeting)
+    if has_summary:
+        conditions.append(DBLatestSummary.issue_id.is_not(None))
+
+    summary_columns = [
+        (
+            DBSummary.__table__.c[field]
+            if with_summary and (with_summary_text or field != "summary")
+            else null()
+        ).label(SUMMARY_PREFIX + field)
+        for field in SUMMARY_FIELDS
+    ]
+
+    if not with_summary:
+        query = select(*_MEETING_COLUMNS, *summary_columns)
+        if has_summary:
+            query = query.outerjoin(
+                DBLatestSummary, DBMeeting.issue_id == DBLatestSummary.issue_id
+            )
+        return query.where(and_(*conditions)).order_by(DBMeeting.issue_id)
+
+    # 最新の要約はlatest_summariesを経由して結合する
+    return (
+        select(*_MEETING_COLUMNS, *summary_columns)
+        .outerjoin(DBLatestSummary, DBMeeting.issue_id == DBLatestSummary.issue_id)
+        .outerjoin(
+            DBSummary,
+            and_(
+                DBSummary.issue_id == DBLatestSummary.issue_id,
+                DBSummary.model == DBLatestSummary.model,
+                DBSummary.prompt_version == DBLatestSummary.prompt_version,
+            ),
+        )
+        .where(and_(*conditions))
+        .order_by(DBMeeting.issue_id)
+    )
+
+
+def _meeting_names_query(session: int):
+    return (
+        select(DBMeeting.name_of_meeting).distinct().where(DBMeeting.session == session)
+    )
+
+
+async def _load_meeting(
+    info: Info,
+    issue_id: str,
+    session: Optional[int] = None,
+    name_of_house: Optional[str] = None,
+    name_of_meeting: Optional[str] = None,
+    has_summary: Optional[bool] = False,
+) -> List[Meeting]:
+    """
+    issue_idを指定したMeetingをDataLoader(プロセス内のキャッシュ)から取得する
+    その他の条件は取得した行で確かめる
+    """
+    dataloaders: DataLoaders = info.context["dataloaders"]
+    row = await dataloaders.meetings_by_issue_id.load(issue_id)
+    if row is None:
+        return []
+    if (
+        (session and row.session != session)
+        or (name_of_house and row.name_of_house != name_of_house)
+        or (name_of_meeting and row.name_of_meeting != name_of_meeting)
+    ):
+        return []
+
+    # 要約は作成・更新されるためキャッシュせず、必要な場合だけ取得する
+    summary = None
+    with_summary = is_selected(info, "summary")
+    if has_summary or with_summary:
+        summary_row = await dataloaders.latest_summaries_by_issue_id.load(issue_id)
+        if has_summary and summary_row is None:
+            return []
+        if with_summary and summary_row is not None:
+            summary = latest_summary_from_row(summary_row)
+    return [_meeting_from_row(row, summary=summary)]
+
+
 @strawberry.type
 class Query:
     @strawberry.field
@@ -131,154 +289,141 @@ class Query:
             raise ValueError("Either 'session' or 'issue_id' must be provided.")
 
         try:
-            conditions = []
-            if session:
-                conditions.append(DBMeeting.session == session)
             if issue_id:
-                conditions.append(DBMeeting.issue_id == issue_id)
-            if name_of_house:
-                conditions.append(DBMeeting.name_of_house == name_of_house)
-            if name_of_meeting:
-                conditions.append(DBMeeting.name_of_meeting == name_of_meeting)
-            if has_summary:
-                conditions.append(DBSummary.issue_id is not None)
-
-            subquery = (
-                select(
-                    DBMeeting,
-                    DBSummary,
-                    func.row_number()
-                    .over(
-                        partition_by=DBMeeting.issue_id,
-                        order_by=(
-                            DBSummary.prompt_version.desc(),
-                            DBSummary.update_time.desc(),
-                        ),
-                    )
-                    .label("rn"),
+                return await _load_meeting(
+                    info,
+                    issue_id,
+                    session,
+                    name_of_house,
+                    name_of_meeting,
+                    has_summary,
                 )
-                .select_from(DBMeeting)
-                .outerjoin(DBSummary, DBMeeting.issue_id == DBSummary.issue_id)
-                .where(and_(*conditions))
-                .subquery()
+            # 要求されたフィールドに応じて要約の結合・本文の読み込みを省く
+            query = _meetings_query(
+                session,
+                issue_id,
+                name_of_house,
+                name_of_meeting,
+                has_summary,
+                with_summary=is_selected(info, "summary"),
+                with_summary_text=is_selected(info, "summary", "summary"),
             )
-
-            MeetingAlias = aliased(DBMeeting, subquery)
-            SummaryAlias = aliased(DBSummary, subquery)
-
-            query = (
-                select(MeetingAlias, SummaryAlias)
-                .where(subquery.c.rn == 1)
-                .order_by(subquery.c.issue_id)
-            )
-
             results = (await db_session.execute(query)).all()
-
-            meetings = []
-            for meeting_obj, summary_obj in results:
-                summary_dto = None
-                if summary_obj and summary_obj.issue_id:
-                    summary_dto = Summary(
-                        summary=summary_obj.summary,
-                        model=summary_obj.model,
-                        prompt_version=summary_obj.prompt_version,
-                        create_time=summary_obj.create_time.isoformat()
-                        if summary_obj.create_time
-                        else None,
-                        update_time=summary_obj.update_time.isoformat()
-                        if summary_obj.update_time
-                        else None,
-                    )
-
-                meetings.append(
-                    Meeting(
-                        issue_id=meeting_obj.issue_id,
-                        image_kind=meeting_obj.image_kind,
-                        search_object=meeting_obj.search_object,
-                        session=meeting_obj.session,
-                        name_of_house=meeting_obj.name_of_house,
-                        name_of_meeting=meeting_obj.name_of_meeting,
-                        issue=meeting_obj.issue,
-                        date=meeting_obj.date,
-                        closing=meeting_obj.closing,
-                        meeting_url=meeting_obj.meeting_url,
-                        pdf_url=meeting_obj.pdf_url,
-                        summary=summary_dto,
-                    )
-                )
-            return meetings
+            return [meeting_from_row(row) for row in results]
         except Exception as e:
             await db_session.rollback()
             print(e)
             raise
 
     @strawberry.field
-    async def speeches(self, info, speech_id: Optional[str] = None) -> List[Speech]:
-        session: AsyncSession = info.context["session"]
+    async def meetings_connection(
+        self,
+        info: Info,
+        session: Optional[int] = None,
+        name_of_house: Optional[str] = None,
+        name_of_meeting: Optional[str] = None,
+        has_summary: Optional[bool] = False,
+        first: Optional[int] = None,
+        after: Optional[str] = None,
+    ) -> Connection[Meeting]:
+        """
+        issue_id順にMeetingをページ単位で取得する
+        afterには前のページのend_cursorを渡す
+        """
+        db_session: AsyncSession = info.context["session"]
+        limit = page_size(first)
+        query = _meetings_query(
+            session,
+            None,
+            name_of_house,
+            name_of_meeting,
+            has_summary,
+            with_summary=is_selected(info, "edges", "node", "summary"),
+            with_summary_text=is_selected(info, "edges", "node", "summary", "summary"),
+        )
+        if after:
+            (after_issue_id,) = decode_cursor(after, 1)
+            query = query.where(DBMeeting.issue_id > after_issue_id)
+        results = (await db_session.execute(query.limit(limit + 1))).all()
+        return build_connection(
+            results,
+            limit,
+            node=meeting_from_row,
+            key=lambda row: (row.issue_id,),
+        )
+
+    @strawberry.field
+    async def speeches(
+        self,
+        info,
+        speech_id: Optional[str] = None,
+        session: Optional[int] = None,
+    ) -> List[Speech]:
+        """
+        speech_idを指定しない場合は先頭のMAX_PAGE_SIZE件のみを返す
+        全件の取得にはspeechesConnectionを使う
+        sessionを指定するとspeechesのパーティションを1つに絞って検索する
+        """
+        db_session: AsyncSession = info.context["session"]
+        query = select(*_SPEECH_COLUMNS)
+        if session:
+            query = query.where(DBSpeech.session == session)
         if speech_id:
-            db_speeches = (
-                (
-                    await session.execute(
-                        select(DBSpeech).where(DBSpeech.speech_id == speech_id)
-                    )
-                )
-                .scalars()
-                .all()
-            )
+            query = query.where(DBSpeech.speech_id == speech_id)
         else:
-            db_speeches = (await session.execute(select(DBSpeech))).scalars().all()
-        return [
-            Speech(
-                speech_id=s.speech_id,
-                speech_order=s.speech_order,
-                speaker=s.speaker,
-                speaker_yomi=s.speaker_yomi,
-                speaker_group=s.speaker_group,
-                speaker_position=s.speaker_position,
-                speaker_role=s.speaker_role,
-                speech=s.speech,
-                start_page=s.start_page,
-                create_time=s.create_time.isoformat() if s.create_time else None,
-                update_time=s.update_time.isoformat() if s.update_time else None,
-                speech_url=s.speech_url,
+            query = query.order_by(DBSpeech.issue_id, DBSpeech.speech_order).limit(
+                MAX_PAGE_SIZE
             )
-            for s in db_speeches
-        ]
+        db_speeches = (await db_session.execute(query)).all()
+        return [speech_from_row(s) for s in db_speeches]
 
     @strawberry.field
-    async def sessions(self, info) -> List[Session]:
+    async def speeches_connection(
+        self,
+        info: Info,
+        issue_id: Optional[str] = None,
+        session: Optional[int] = None,
+        first: Optional[int] = None,
+        after: Optional[str] = None,
+    ) -> Connection[Speech]:
+        """
+        (issue_id, speech_order)順にSpeechをページ単位で取得する
+        afterには前のページのend_cursorを渡す
+        sessionを指定するとspeechesのパーティションを1つに絞って検索する
+        """
         db_session: AsyncSession = info.context["session"]
-        db_sessions = (
-            (
-                await db_session.execute(
-                    select(DBSession).order_by(DBSession.session.desc())
-                )
-            )
-            .scalars()
-            .all()
+        limit = page_size(first)
+        query = select(*_SPEECH_COLUMNS).order_by(
+            DBSpeech.issue_id, DBSpeech.speech_order
         )
-        return [
-            Session(
-                session=s.session,
-                name=s.name,
-                start_date=s.start_date,
-                end_date=s.end_date,
+        if session:
+            query = query.where(DBSpeech.session == session)
+        if issue_id:
+            query = query.where(DBSpeech.issue_id == issue_id)
+        if after:
+            after_issue_id, after_order = decode_cursor(after, 2)
+            query = query.where(
+                tuple_(DBSpeech.issue_id, DBSpeech.speech_order)
+                > tuple_(after_issue_id, after_order)
             )
-            for s in db_sessions
-        ]
+        db_speeches = (await db_session.execute(query.limit(limit + 1))).all()
+        return build_connection(
+            list(db_speeches),
+            limit,
+            node=speech_from_row,
+            key=lambda s: (s.issue_id, s.speech_order),
+        )
+
+    @strawberry.field
+    async def sessions(self, info) -> List[Session]:
+        dataloaders: DataLoaders = info.context["dataloaders"]
+        db_sessions = await dataloaders.all_sessions.load(ALL_SESSIONS)
+        return [session_from_row(s) for s in db_sessions]
 
     @strawberry.field
     async def meeting_names(self, info, session: int) -> List[str]:
         db_session: AsyncSession = info.context["session"]
         db_meeting_names = (
-            (
-                await db_session.execute(
-                    select(distinct(DBMeeting.name_of_meeting)).where(
-                        DBMeeting.session == session
-                    )
-                )
-            )
-            .scalars()
-            .all()
+            (await db_session.execute(_meeting_names_query(session))).scalars().all()
         )
         return [name for name in db_meeting_names if name]
@@ -0,0 +1,33 @@
+from typing import Iterable, List, Optional
+
+from strawberry.types import Info
+from strawberry.types.nodes import FragmentSpread, InlineFragment, SelectedField
+
+
+def _flatten(selections: Iterable) -> List[SelectedField]:
+    """フラグメントを展開して、選択されたフィールドの一覧にする"""
+    fields = []
+    for selection in selections:
+        if isinstance(selection, (FragmentSpread, InlineFragment)):
+            fields.extend(_flatten(selection.selections))
+        else:
+            fields.append(selection)
+    return fields
+
+
+def find_selection(
+    selections: Iterable, path: Iterable[str]
+) -> Optional[SelectedField]:
+    """GraphQLのフィールド名のpathをたどり、選択されていればそのフィールドを返す"""
+    field = None
+    for name in path:
+        field = next((f for f in _flatten(selections) if f.name == name), None)
+        if field is None:
+            return None
+        selections = field.selections
+    return field
+
+
+def is_selected(info: Info, *path: str) -> bool:
+    """リゾルバのフィールドの下でpathのフィールドが要求されているか"""
+    return find_selection(info.selected_fields[0].selections, path) is not None
@@ -0,0 +1,157 @@
+"""
+読み取り系リゾルバの行からGraphQLの型への変換のスループット計測
+
+DATABASE_URLのDBから国会回次1つ分の会議・発言を取得し、以下を比べる (DBは書き換えない)
+    orm:  ORMのエンティティにしてから属性を1つずつGraphQLの型にコピーする (以前のfrom_db)
+    core: CoreのRowを取得し、mappersのRowMapperで変換する (現在の実装)
+
+例 (api/で実行):
+    python -m benchmarks.row_mapping_bench --session 217 --repeat 10
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+from kokkai_db.database import create_async_engine_and_session
+from kokkai_db.schema import Meeting as DBMeeting
+from kokkai_db.schema import Speech as DBSpeech
+from sqlalchemy import select
+
+from app.graphql.resolvers import (
+    _SPEECH_COLUMNS,
+    Meeting,
+    Speech,
+    _meetings_query,
+    meeting_from_row,
+    speech_from_row,
+)
+
+
+def legacy_speech_from_db(s: DBSpeech) -> Speech:
+    return Speech(
+        speech_id=s.speech_id,
+        session=s.session,
+        speech_order=s.speech_order,
+        speaker=s.speaker,
+        speaker_yomi=s.speaker_yomi,
+        speaker_group=s.speaker_group,
+        speaker_position=s.speaker_position,
+        speaker_role=s.speaker_role,
+        start_page=s.start_page,
+        create_time=s.create_time.isoformat() if s.create_time else None,
+        update_time=s.update_time.isoformat() if s.update_time else None,
+        speech_url=s.speech_url,
+    )
+
+
+def legacy_meeting_from_db(m: DBMeeting) -> Meeting:
+    return Meeting(
+        issue_id=m.issue_id,
+        image_kind=m.image_kind,
+        search_object=m.search_object,
+        session=m.session,
+        name_of_house=m.name_of_house,
+        name_of_meeting=m.name_of_meeting,
+        issue=m.issue,
+        date=m.date,
+        closing=m.closing,
+        meeting_url=m.meeting_url,
+        pdf_url=m.pdf_url,
+        speech_count=m.speech_count,
+        total_chars=m.total_chars,
+        speaker_count=m.speaker_count,
+        first_speech_order=m.first_speech_order,
+        last_speech_order=m.last_speech_order,
+        summary=None,
+    )
+
+
+async def fetch_orm(session, session_number: int) -> tuple[list, list]:
+    meetings = (
+        (
+            await session.execute(
+                select(DBMeeting)
+                .where(DBMeeting.session == session_number)
+                .order_by(DBMeeting.issue_id)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    speeches = (
+        (
+            await session.execute(
+                select(DBSpeech)
+                .where(DBSpeech.session == session_number)
+                .order_by(DBSpeech.issue_id, DBSpeech.speech_order)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    return (
+        [legacy_meeting_from_db(m) for m in meetings],
+        [legacy_speech_from_db(s) for s in speeches],
+    )
+
+
+async def fetch_core(session, session_number: int) -> tuple[list, list]:
+    meetings = (
+        await session.execute(_meetings_query(session_number, with_summary=False))
+    ).all()
+    speeches = (
+        await session.execute(
+            select(*_SPEECH_COLUMNS)
+            .where(DBSpeech.session == session_number)
+            .order_by(DBSpeech.issue_id, DBSpeech.speech_order)
+        )
+    ).all()
+    return (
+        [meeting_from_row(m) for m in meetings],
+        [speech_from_row(s) for s in speeches],
+    )
+
+
+async def bench(args):
+    engine, SessionLocal = create_async_engine_and_session(args.database_url, "api")
+    print(f"session {args.session}, median of {args.repeat}")
+    for name, fetch in (("orm", fetch_orm), ("core", fetch_core)):
+        timings = []
+        # 1回目は接続の確立・プリペアの分を除くため捨てる
+        for _ in range(args.repeat + 1):
+            # リクエストごとにセッションを作る (identity mapを引き継がない)
+            async with SessionLocal() as session:
+                started = time.perf_counter()
+                meetings, speeches = await fetch(session, args.session)
+                timings.append(time.perf_counter() - started)
+        median = statistics.median(timings[1:])
+        rows = len(meetings) + len(speeches)
+        print(
+            f"{name:>4}: {len(meetings):,} meetings + {len(speeches):,} speeches "
+            f"in {median * 1000:.1f} ms ({rows / median:,.0f} rows/s)"
+        )
+    await engine.dispose()
+
+
+def main(argv: list[str] | None = None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--session", type=int, required=True)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--database-url",
+        default=os.environ.get("DATABASE_URL"),
+        help="defaults to the DATABASE_URL environment variable",
+    )
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("DATABASE_URL environment variable not set.")
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
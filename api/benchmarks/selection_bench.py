@@ -0,0 +1,196 @@
+"""
+webアプリのGraphQLクエリごとのSQL文の数・読み込んだバイト数・レイテンシの計測
+
+一覧ページ(SearchMeetings)と詳細ページ(GetMeetingDetails)などのクエリをDATABASE_URLのDBに対して実行し、
+以下を比べる (DBは書き換えない)
+    legacy:  要求されたフィールドに関係なく要約を結合し、本文まで読み込む (以前の実装)
+    current: 要求されたフィールドに必要な列・結合だけを読み込む (現在の実装)
+バイト数は取得した列の値をテキストにした長さの合計 (psycopgのテキスト形式での転送量の目安)
+
+例 (api/で実行):
+    python -m benchmarks.selection_bench --session 217 --repeat 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from dataclasses import dataclass
+
+import strawberry
+from dotenv import load_dotenv
+from kokkai_db.database import create_async_engine_and_session
+from sqlalchemy import text
+
+from app.graphql import resolvers
+from app.graphql.dataloaders import DataLoaders
+from app.graphql.resolvers import Query
+
+# web/app/routes/index/route.tsx
+SEARCH_MEETINGS_QUERY = """
+query SearchMeetings($session: Int!, $hasSummary: Boolean) {
+  meetings(session: $session, hasSummary: $hasSummary) {
+    issueId
+    session
+    nameOfHouse
+    nameOfMeeting
+    issue
+    date
+  }
+}
+"""
+
+# web/app/routes/summary/route.tsx
+GET_MEETING_DETAILS_QUERY = """
+query GetMeetingDetails($issueId: String!) {
+  meetings(issueId: $issueId) {
+    issueId
+    session
+    nameOfHouse
+    nameOfMeeting
+    issue
+    date
+    summary {
+      summary
+      model
+    }
+  }
+}
+"""
+
+# 発言者の一覧だけを要求する場合 (発言の本文は読み込まない)
+GET_SPEAKERS_QUERY = """
+query GetSpeakers($issueId: String!) {
+  meetings(issueId: $issueId) {
+    issueId
+    speeches {
+      speechOrder
+      speaker
+      speakerGroup
+    }
+  }
+}
+"""
+
+
+@dataclass
+class Reads:
+    statements: int = 0
+    rows: int = 0
+    bytes: int = 0
+
+
+def value_bytes(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, bytes):
+        return len(value)
+    return len(str(value).encode())
+
+
+def record_reads(session, reads: Reads):
+    """sessionで実行したSQL文の数と、取得した行・バイト数を数える"""
+    execute = session.execute
+
+    async def recorded(*args, **kwargs):
+        frozen = (await execute(*args, **kwargs)).freeze()
+        reads.statements += 1
+        reads.rows += len(frozen.data)
+        reads.bytes += sum(value_bytes(v) for row in frozen.data for v in row)
+        return frozen()
+
+    session.execute = recorded
+
+
+async def run_query(schema, SessionLocal, query: str, variables: dict):
+    """(経過秒数, Reads)を返す"""
+    reads = Reads()
+    async with SessionLocal() as session:
+        record_reads(session, reads)
+        context = {"session": session, "dataloaders": DataLoaders(session)}
+        started = time.perf_counter()
+        result = await schema.execute(
+            query, variable_values=variables, context_value=context
+        )
+        elapsed = time.perf_counter() - started
+    if result.errors:
+        raise result.errors[0]
+    return elapsed, reads
+
+
+async def pick_issue_id(SessionLocal, session_number: int) -> str:
+    """国会回次のうち、要約のある会議を優先して1件選ぶ"""
+    async with SessionLocal() as session:
+        issue_id = (
+            await session.execute(
+                text(
+                    "SELECT m.issue_id FROM meetings m "
+                    "LEFT JOIN latest_summaries l USING (issue_id) "
+                    "WHERE m.session = :session "
+                    "ORDER BY l.issue_id IS NULL, m.speech_count DESC LIMIT 1"
+                ),
+                {"session": session_number},
+            )
+        ).scalar()
+    if issue_id is None:
+        raise SystemExit(f"No meetings in session {session_number}")
+    return issue_id
+
+
+async def bench(args):
+    engine, SessionLocal = create_async_engine_and_session(args.database_url, "api")
+    schema = strawberry.Schema(query=Query)
+    issue_id = args.issue_id or await pick_issue_id(SessionLocal, args.session)
+    queries = (
+        ("list", SEARCH_MEETINGS_QUERY, {"session": args.session, "hasSummary": True}),
+        # 「要約のない会議も含める」場合
+        ("list-all", SEARCH_MEETINGS_QUERY, {"session": args.session}),
+        ("detail", GET_MEETING_DETAILS_QUERY, {"issueId": issue_id}),
+        ("speakers", GET_SPEAKERS_QUERY, {"issueId": issue_id}),
+    )
+    print(f"session {args.session}, issue_id {issue_id}, median of {args.repeat}")
+
+    is_selected = resolvers.is_selected
+    for mode in ("legacy", "current"):
+        if mode == "legacy":
+            resolvers.is_selected = lambda info, *path: True
+        else:
+            resolvers.is_selected = is_selected
+        for name, query, variables in queries:
+            # 1回目は接続の確立・プリペアの分を除くため捨てる
+            await run_query(schema, SessionLocal, query, variables)
+            runs = [
+                await run_query(schema, SessionLocal, query, variables)
+                for _ in range(args.repeat)
+            ]
+            reads = runs[0][1]
+            median = statistics.median(elapsed for elapsed, _ in runs)
+            print(
+                f"{mode:>7} {name:<8}: {reads.statements} statements, "
+                f"{reads.rows:,} rows, {reads.bytes / 1024:,.1f} KiB, "
+                f"{median * 1000:.1f} ms"
+            )
+    resolvers.is_selected = is_selected
+    await engine.dispose()
+
+
+def main(argv: list[str] | None = None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--session", type=int, required=True)
+    parser.add_argument("--issue-id", help="defaults to a summarized meeting")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--database-url",
+        default=os.environ.get("DATABASE_URL"),
+        help="defaults to the DATABASE_URL environment variable",
+    )
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("DATABASE_URL environment variable not set.")
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
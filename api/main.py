@@ -1,13 +1,15 @@
+import asyncio
 import os
 
 import strawberry
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware # 追加
 from strawberry.fastapi import GraphQLRouter
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from kokkai_db.database import create_async_engine_and_session
 
 from app.graphql.resolvers import Query
 from app.graphql.dataloaders import DataLoaders
+from app.cache import EntityCaches, listen_for_invalidation
 
 def get_secret(secret_name: str) -> str | None:
     secret_path = f"/run/secrets/{secret_name}"
@@ -21,23 +23,31 @@ DATABASE_URL = get_secret("database_url")
 if DATABASE_URL is None:
     raise Exception("DATABASE_URL secret or environment variable not set.")
 
-# 非同期エンジンを作成
-async_engine = create_async_engine(DATABASE_URL, echo=True)
+# 非同期エンジンとセッションを作成 (プール設定はkokkai_dbの"api"プロファイル)
+async_engine, AsyncSessionLocal = create_async_engine_and_session(DATABASE_URL, "api")
+
+# リクエストをまたいで会議・発言・国会回次を保持するキャッシュ (0で無効)
+CACHE_MAX_BYTES = int(os.environ.get("API_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_TTL_SECONDS = float(os.environ.get("API_CACHE_TTL_SECONDS", 3600))
+# 無効化の通知のLISTENはPgBouncerを経由せずに接続する
+CACHE_LISTEN_DATABASE_URL = get_secret("cache_listen_database_url") or DATABASE_URL
+# キャッシュの統計(/cache/stats)を公開するか (運用時の確認用、既定では公開しない)
+CACHE_STATS_ENABLED = os.environ.get("API_CACHE_STATS_ENABLED", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
 
-# 非同期セッションを作成
-AsyncSessionLocal = async_sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=async_engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
+caches = (
+    EntityCaches(CACHE_MAX_BYTES, CACHE_TTL_SECONDS) if CACHE_MAX_BYTES > 0 else None
 )
+cache_listener: asyncio.Task | None = None
 
 
 async def get_context(request: Request) -> dict:
     session = AsyncSessionLocal()
     try:
-        return {"session": session, "dataloaders": DataLoaders(session)}
+        return {"session": session, "dataloaders": DataLoaders(session, caches)}
     finally:
         await session.close()
 
@@ -65,6 +75,24 @@ app.add_middleware(
 app.include_router(graphql_app, prefix="/graphql")
 
 
+if CACHE_STATS_ENABLED:
+
+    @app.get("/cache/stats")
+    async def cache_stats():
+        return caches.stats() if caches else {}
+
+
+@app.on_event("startup")
+async def startup():
+    global cache_listener
+    if caches:
+        cache_listener = asyncio.create_task(
+            listen_for_invalidation(CACHE_LISTEN_DATABASE_URL, caches)
+        )
+
+
 @app.on_event("shutdown")
 async def shutdown():
+    if cache_listener:
+        cache_listener.cancel()
     await async_engine.dispose()
\ No newline at end of file
@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from app import cache as cache_module
+from app.cache import (
+    ALL_SESSIONS,
+    EntityCache,
+    EntityCaches,
+    estimate_size,
+    load_through,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def make_cache(max_bytes=10_000, ttl=60.0, **kwargs) -> EntityCache:
+    cache = EntityCache("test", max_bytes, ttl, **kwargs)
+    cache.enabled = True
+    return cache
+
+
+def entry_size(key, value) -> int:
+    return estimate_size(key) + estimate_size(value)
+
+
+def test_disabled_cache_stores_nothing():
+    cache = EntityCache("test", 10_000, 60.0)
+
+    cache.put("a", "value")
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_tracks_bytes_hits_and_misses():
+    cache = make_cache()
+
+    cache.put("a", "value")
+    cache.put("b", ("x", 1))
+    assert cache.bytes == entry_size("a", "value") + entry_size("b", ("x", 1))
+
+    assert cache.get("a") == "value"
+    assert cache.get("missing") is None
+    # 同じキーの置き換えでは古い値の分を差し引く
+    cache.put("a", "longer value")
+    assert cache.bytes == entry_size("a", "longer value") + entry_size("b", ("x", 1))
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 2)
+
+
+def test_evicts_least_recently_used():
+    size = entry_size("a", "value")
+    cache = make_cache(max_bytes=size * 2)
+
+    cache.put("a", "value")
+    cache.put("b", "value")
+    cache.get("a")
+    cache.put("c", "value")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "value"
+    assert cache.get("c") == "value"
+    assert cache.evictions == 1
+    assert cache.bytes == size * 2
+
+
+def test_skips_values_larger_than_the_limit():
+    cache = make_cache(max_bytes=100)
+
+    cache.put("a", "x" * 1000)
+
+    assert cache.get("a") is None
+    assert cache.bytes == 0
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = make_cache(ttl=10.0)
+    cache.put("a", "value")
+
+    clock.now += 9.9
+    assert cache.get("a") == "value"
+    clock.now += 0.2
+    assert cache.get("a") is None
+    assert cache.bytes == 0
+
+
+def test_invalidate_removes_keys_by_group():
+    cache = make_cache(group=lambda key: key[0])
+    cache.put(("M1", "all"), "speeches")
+    cache.put(("M1", "limit 10"), "speeches")
+    cache.put(("M2", "all"), "speeches")
+
+    assert cache.invalidate(["M1"]) == 2
+
+    assert cache.get(("M1", "all")) is None
+    assert cache.get(("M2", "all")) == "speeches"
+    assert cache.bytes == entry_size(("M2", "all"), "speeches")
+
+
+def test_put_from_before_an_invalidation_is_discarded():
+    cache = make_cache()
+    generation = cache.generation
+
+    cache.invalidate(["a"])
+    cache.put("a", "stale", generation)
+
+    assert cache.get("a") is None
+
+
+def test_session_invalidation_drops_the_session_list():
+    caches = EntityCaches(100_000, 60.0)
+    caches.set_enabled(True)
+    caches.sessions.put(217, "session")
+    caches.sessions.put(ALL_SESSIONS, ["session"])
+
+    caches.invalidate("sessions", [218])
+
+    assert caches.sessions.get(ALL_SESSIONS) is None
+    assert caches.sessions.get(217) == "session"
+
+
+def test_set_enabled_clears_entries():
+    caches = EntityCaches(100_000, 60.0)
+    caches.set_enabled(True)
+    caches.meetings.put("M1", "meeting")
+
+    caches.set_enabled(False)
+    caches.set_enabled(True)
+
+    assert caches.meetings.get("M1") is None
+    assert caches.stats()["meetings"]["bytes"] == 0
+
+
+def test_load_through_loads_only_missing_keys():
+    cache = make_cache()
+    cache.put("a", "cached")
+    loaded = []
+
+    async def load(keys):
+        loaded.append(keys)
+        return [f"loaded {key}" for key in keys]
+
+    result = asyncio.run(load_through(cache, ["a", "b"], load))
+    again = asyncio.run(load_through(cache, ["a", "b"], load))
+
+    assert result == again == ["cached", "loaded b"]
+    assert loaded == [["b"]]
+
+
+def test_load_through_does_not_cache_results_invalidated_while_loading():
+    cache = make_cache()
+
+    async def load(keys):
+        # 読み込み中に無効化の通知が届いた
+        cache.invalidate(keys)
+        return ["stale" for _ in keys]
+
+    assert asyncio.run(load_through(cache, ["a"], load)) == ["stale"]
+    assert cache.get("a") is None
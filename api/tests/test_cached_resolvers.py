@@ -0,0 +1,200 @@
+"""
+issue_idを指定したmeetingsとsessionsが、2回目以降はプロセス内のキャッシュから返ること
+会議の発言と本文は国会回次でパーティションを絞って取得すること
+TEST_DATABASE_URLに空のテスト用DBを指定した場合だけ実行する (スキーマはロールバックで消える)
+"""
+
+import asyncio
+import os
+from datetime import date, datetime
+
+import pytest
+import strawberry
+from kokkai_db.partitions import ensure_session_partitions
+from kokkai_db.schema import (
+    Base,
+    LatestSummary,
+    Meeting,
+    Session,
+    Speech,
+    SpeechBody,
+    Summary,
+)
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.cache import EntityCaches
+from app.graphql.dataloaders import DataLoaders
+from app.graphql.resolvers import Query
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set"
+)
+
+DETAIL_QUERY = """
+query Detail($issueId: String!, $session: Int) {
+  meetings(issueId: $issueId, session: $session) {
+    issueId
+    nameOfMeeting
+    summary {
+      summary
+      model
+    }
+  }
+}
+"""
+SESSIONS_QUERY = "{ sessions { session name } }"
+SPEECHES_QUERY = """
+query Speeches($issueId: String!) {
+  meetings(issueId: $issueId) {
+    speeches {
+      speechId
+      session
+      speech
+    }
+  }
+}
+"""
+
+
+async def seed(conn):
+    await conn.run_sync(Base.metadata.create_all)
+    await conn.run_sync(ensure_session_partitions, [217])
+    await conn.execute(
+        insert(Session).values(
+            session=217,
+            name="第217回 常会",
+            start_date=date(2025, 1, 24),
+            end_date=date(2025, 6, 22),
+        )
+    )
+    await conn.execute(
+        insert(Meeting).values(
+            issue_id="121705261X00120250124",
+            image_kind="会議録",
+            search_object=0,
+            session=217,
+            name_of_house="衆議院",
+            name_of_meeting="本会議",
+            issue="第1号",
+            meeting_url="https://kokkai.ndl.go.jp/txt/121705261X00120250124",
+        )
+    )
+    await conn.execute(
+        insert(Speech).values(
+            issue_id="121705261X00120250124",
+            speech_id="121705261X00120250124_000",
+            session=217,
+            speech_order=0,
+            speech_url="https://kokkai.ndl.go.jp/txt/121705261X00120250124/0",
+        )
+    )
+    await conn.execute(
+        insert(SpeechBody).values(
+            speech_id="121705261X00120250124_000", session=217, speech="発言"
+        )
+    )
+    now = datetime(2025, 2, 1)
+    await conn.execute(
+        insert(Summary).values(
+            issue_id="121705261X00120250124",
+            summary="要約",
+            model="gemini",
+            prompt_version=1,
+            create_time=now,
+            update_time=now,
+        )
+    )
+    await conn.execute(
+        insert(LatestSummary).values(
+            issue_id="121705261X00120250124", model="gemini", prompt_version=1
+        )
+    )
+
+
+async def execute_requests(requests) -> tuple[list, list[str]]:
+    """同じキャッシュで(クエリ, 変数)を1リクエストずつ実行し、(結果, SQL文)を返す"""
+    engine = create_async_engine(TEST_DATABASE_URL)
+    schema = strawberry.Schema(query=Query)
+    caches = EntityCaches(1024 * 1024, 60.0)
+    caches.set_enabled(True)
+    statements = []
+    results = []
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        await seed(conn)
+        event.listen(
+            conn.sync_connection,
+            "before_cursor_execute",
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+        for query, variables in requests:
+            session = AsyncSession(bind=conn, join_transaction_mode="create_savepoint")
+            result = await schema.execute(
+                query,
+                variable_values=variables,
+                context_value={
+                    "session": session,
+                    "dataloaders": DataLoaders(session, caches),
+                },
+            )
+            assert result.errors is None
+            results.append(result.data)
+            await session.close()
+        await trans.rollback()
+    await engine.dispose()
+    return results, statements
+
+
+def test_meeting_by_issue_id_is_served_from_cache():
+    variables = {"issueId": "121705261X00120250124"}
+    results, statements = asyncio.run(
+        execute_requests(
+            [
+                (DETAIL_QUERY, variables),
+                (DETAIL_QUERY, variables),
+                (DETAIL_QUERY, {**variables, "session": 218}),
+            ]
+        )
+    )
+
+    expected = {
+        "meetings": [
+            {
+                "issueId": "121705261X00120250124",
+                "nameOfMeeting": "本会議",
+                "summary": {"summary": "要約", "model": "gemini"},
+            }
+        ]
+    }
+    assert results == [expected, expected, {"meetings": []}]
+    # 会議は1回だけ読み込み、更新されうる要約は毎回読み込む
+    assert sum("FROM meetings" in s for s in statements) == 1
+    assert sum("FROM summaries" in s for s in statements) == 2
+
+
+def test_sessions_are_served_from_cache():
+    results, statements = asyncio.run(
+        execute_requests([(SESSIONS_QUERY, None), (SESSIONS_QUERY, None)])
+    )
+
+    expected = {"sessions": [{"session": 217, "name": "第217回 常会"}]}
+    assert results == [expected, expected]
+    assert sum("FROM sessions" in s for s in statements) == 1
+
+
+def test_speeches_are_narrowed_to_the_meeting_session():
+    results, statements = asyncio.run(
+        execute_requests([(SPEECHES_QUERY, {"issueId": "121705261X00120250124"})])
+    )
+
+    speech = {"speechId": "121705261X00120250124_000", "session": 217, "speech": "発言"}
+    assert results == [{"meetings": [{"speeches": [speech]}]}]
+    # パーティションキーの条件がなければ、全パーティションの索引を検索してしまう
+    speech_statements = [s for s in statements if "FROM speeches" in s]
+    body_statements = [s for s in statements if "FROM speech_bodies" in s]
+    assert speech_statements and body_statements
+    assert all("speeches.session = " in s for s in speech_statements)
+    assert all("speech_bodies.session = " in s for s in body_statements)
@@ -0,0 +1,165 @@
+"""
+リゾルバ・DataLoaderの頻出クエリがインデックスを使い、発言は国会回次のパーティションだけを読むことをEXPLAINで確かめる
+TEST_DATABASE_URLに空のテスト用DBを指定した場合だけ実行する
+
+本番に近い計画になるよう、専用のスキーマにコミットしてVACUUM ANALYZEし、最後にスキーマごと削除する
+"""
+
+import os
+
+import pytest
+from kokkai_db.explain import explain, scanned_tables, seq_scanned_tables, used_indexes
+from kokkai_db.partitions import ensure_session_partitions, partition_name
+from kokkai_db.schema import Base
+from sqlalchemy import create_engine, text
+
+from app.graphql.dataloaders import (
+    SpeechFilter,
+    _latest_summaries_query,
+    _meetings_by_issue_ids_query,
+    _speech_bodies_query,
+    _speeches_query,
+)
+from app.graphql.resolvers import _meeting_names_query, _meetings_query
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set"
+)
+
+SCHEMA = "api_query_plans"
+SESSIONS = (210, 211, 212, 213)
+SESSION = SESSIONS[0]
+MEETINGS = 2000
+SPEECHES_PER_MEETING = 20
+
+
+def issue_ids_in(session: int, count: int) -> list[str]:
+    """seedでsessionに割り当てた会議のissue_idを返す"""
+    ids = range(len(SESSIONS) + SESSIONS.index(session), MEETINGS, len(SESSIONS))
+    return [f"M{i}" for i in ids[:count]]
+
+
+def seed(conn):
+    params = {
+        "first": SESSION,
+        "sessions": len(SESSIONS),
+        "meetings": MEETINGS,
+        "speeches": SPEECHES_PER_MEETING,
+    }
+    conn.execute(
+        text(
+            "INSERT INTO meetings (issue_id, image_kind, search_object, session, "
+            "name_of_house, name_of_meeting, issue, meeting_url, speech_count) "
+            "SELECT 'M' || i, '会議録', 0, :first + i % :sessions, '衆議院', "
+            "'委員会' || (i % 50), '第1号', 'https://example.com/' || i, :speeches "
+            "FROM generate_series(1, :meetings) AS i"
+        ),
+        params,
+    )
+    conn.execute(
+        text(
+            "INSERT INTO speeches (issue_id, speech_id, session, speech_order, "
+            "speech_url) "
+            "SELECT 'M' || i, 'M' || i || '_' || j, :first + i % :sessions, j, "
+            "'https://example.com/' || i || '/' || j "
+            "FROM generate_series(1, :meetings) AS i, "
+            "generate_series(0, :speeches - 1) AS j"
+        ),
+        params,
+    )
+    conn.execute(
+        text(
+            "INSERT INTO speech_bodies (speech_id, session, speech) "
+            "SELECT speech_id, session, repeat(md5(speech_id), 8) FROM speeches"
+        )
+    )
+    # 要約は本文を含むため、会議の行よりずっと大きい
+    conn.execute(
+        text(
+            "INSERT INTO summaries (issue_id, summary, model, prompt_version, "
+            "create_time, update_time) "
+            "SELECT 'M' || i, repeat(md5(i || '-' || v), 60), 'gemini', v, now(), now() "
+            "FROM generate_series(1, :meetings) AS i, generate_series(1, 2) AS v "
+            "WHERE i % 10 <> 0"
+        ),
+        params,
+    )
+    conn.execute(
+        text(
+            "INSERT INTO latest_summaries (issue_id, model, prompt_version) "
+            "SELECT issue_id, model, max(prompt_version) FROM summaries "
+            "GROUP BY issue_id, model"
+        )
+    )
+
+
+@pytest.fixture(scope="module")
+def conn():
+    engine = create_engine(
+        TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA}"}
+    )
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        Base.metadata.create_all(conn)
+        ensure_session_partitions(conn, SESSIONS)
+        seed(conn)
+        conn.commit()
+        # 本番と同じく可視性マップと統計を作る (トランザクション内では実行できない)
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.execute(text("VACUUM ANALYZE"))
+        try:
+            yield conn
+        finally:
+            conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    engine.dispose()
+
+
+def test_meetings_by_session_and_name_use_index(conn):
+    plan = explain(conn, _meetings_query(SESSION, name_of_meeting="委員会1"))
+    assert "ix_meetings_session_name_of_meeting" in used_indexes(plan)
+    assert "meetings" not in seq_scanned_tables(plan)
+
+
+def test_meeting_names_use_index(conn):
+    plan = explain(conn, _meeting_names_query(SESSION))
+    assert "ix_meetings_session_name_of_meeting" in used_indexes(plan)
+
+
+def test_meetings_by_issue_ids_use_primary_key(conn):
+    plan = explain(conn, _meetings_by_issue_ids_query(issue_ids_in(SESSION, 10)))
+    assert "meetings_pkey" in used_indexes(plan)
+
+
+@pytest.mark.parametrize(
+    "speech_filter",
+    [SpeechFilter(), SpeechFilter(limit=3)],
+    ids=["all", "first-n"],
+)
+def test_speeches_read_one_partition(conn, speech_filter):
+    stmt = _speeches_query(SESSION, issue_ids_in(SESSION, 10), speech_filter)
+    plan = explain(conn, stmt)
+
+    # 国会回次の条件がなければ、全パーティションのインデックスを検索してしまう
+    partition = partition_name("speeches", SESSION)
+    assert scanned_tables(plan) == {partition}
+    # パーティションのインデックスはPostgreSQLが親のインデックスから自動で名前を付ける
+    assert f"{partition}_issue_id_speech_order_idx" in used_indexes(plan)
+
+
+def test_speech_bodies_read_one_partition(conn):
+    speech_ids = [f"{issue_id}_0" for issue_id in issue_ids_in(SESSION, 10)]
+    plan = explain(conn, _speech_bodies_query(SESSION, speech_ids))
+
+    partition = partition_name("speech_bodies", SESSION)
+    assert scanned_tables(plan) == {partition}
+    assert f"{partition}_pkey" in used_indexes(plan)
+
+
+def test_latest_summaries_use_index(conn):
+    plan = explain(conn, _latest_summaries_query(issue_ids_in(SESSION, 10)))
+    # latest_summariesは小さいため全件走査になりうるが、大きいsummariesは走査しない
+    assert "summaries" not in seq_scanned_tables(plan)
+    assert "ix_summaries_issue_id_prompt_version_update_time" in used_indexes(plan)
@@ -1,17 +1,159 @@
-from sqlalchemy import create_engine
+import os
+from dataclasses import dataclass, replace
+from typing import Callable
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from kokkai_db.schema import Base
 
 
-def create_engine_and_session(database_url: str):
+@dataclass(frozen=True)
+class EngineProfile:
+    """サービスごとのエンジン・接続プールの設定"""
+
+    is_async: bool
+    pool_size: int
+    max_overflow: int
+    pool_timeout: float
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    # SQLAlchemyのコンパイル済みSQLのキャッシュ件数
+    query_cache_size: int = 500
+    # executemany(INSERT ... VALUES)を1文にまとめる行数
+    insertmanyvalues_page_size: int = 1000
+    # psycopgがサーバー側のプリペアドステートメントに切り替えるまでの実行回数
+    prepare_threshold: int | None = 5
+
+
+PROFILES: dict[str, EngineProfile] = {
+    # APIサーバー: 同時リクエスト数に合わせた大きめのプールとキャッシュ
+    "api": EngineProfile(
+        is_async=True,
+        pool_size=10,
+        max_overflow=20,
+        pool_timeout=10,
+        query_cache_size=1200,
+    ),
+    # スクレイパーの一括書き込み: executemanyを大きなページで送る
+    "ingest": EngineProfile(
+        is_async=False,
+        pool_size=2,
+        max_overflow=2,
+        pool_timeout=30,
+        insertmanyvalues_page_size=5000,
+    ),
+    # 要約ジョブ: 1件ずつ処理するため小さなプール
+    "worker": EngineProfile(
+        is_async=True,
+        pool_size=2,
+        max_overflow=0,
+        pool_timeout=60,
+    ),
+}
+
+# 環境変数で上書きできるプール設定
+_ENV_OVERRIDES = {
+    "DB_POOL_SIZE": ("pool_size", int),
+    "DB_MAX_OVERFLOW": ("max_overflow", int),
+    "DB_POOL_TIMEOUT": ("pool_timeout", float),
+}
+
+
+def get_profile(name: str, **overrides) -> EngineProfile:
+    """名前付きのプロファイルに環境変数・引数の上書きを適用して返します。"""
+    if name not in PROFILES:
+        raise ValueError(f"Unknown engine profile: {name}")
+    values = {}
+    for env, (field, cast) in _ENV_OVERRIDES.items():
+        if os.environ.get(env):
+            values[field] = cast(os.environ[env])
+    values.update(overrides)
+    return replace(PROFILES[name], **values)
+
+
+def _use_pgbouncer(pgbouncer: bool | None) -> bool:
+    if pgbouncer is not None:
+        return pgbouncer
+    return os.environ.get("DB_PGBOUNCER", "").lower() in ("1", "true", "yes")
+
+
+def pool_stats(engine: Engine | AsyncEngine) -> dict[str, int]:
+    """接続プールの利用状況を返します。"""
+    if isinstance(engine, AsyncEngine):
+        engine = engine.sync_engine
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+def create_db_engine(
+    database_url: str,
+    profile: str = "ingest",
+    *,
+    pgbouncer: bool | None = None,
+    pool_stats_hook: Callable[[dict[str, int]], None] | None = None,
+    **overrides,
+) -> Engine | AsyncEngine:
+    """
+    プロファイルに従ってengineを作成します。
+    pgbouncer(未指定時は環境変数DB_PGBOUNCER)がTrueの場合は、
+    PgBouncerのトランザクションプーリングで使えないプリペアドステートメントを無効にします。
+    pool_stats_hookには接続の貸し出し・返却のたびにプールの利用状況を渡します。
+    """
+    settings = get_profile(profile, **overrides)
+    prepare_threshold = settings.prepare_threshold
+    if _use_pgbouncer(pgbouncer):
+        prepare_threshold = None
+
+    kwargs = dict(
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle,
+        pool_pre_ping=settings.pool_pre_ping,
+        query_cache_size=settings.query_cache_size,
+        insertmanyvalues_page_size=settings.insertmanyvalues_page_size,
+        connect_args={"prepare_threshold": prepare_threshold},
+    )
+    if settings.is_async:
+        engine = create_async_engine(database_url, **kwargs)
+    else:
+        engine = create_engine(database_url, **kwargs)
+
+    if pool_stats_hook is not None:
+        sync_engine = engine.sync_engine if settings.is_async else engine
+
+        def _report(*_):
+            pool_stats_hook(pool_stats(sync_engine))
+
+        event.listen(sync_engine, "checkout", _report)
+        event.listen(sync_engine, "checkin", _report)
+    return engine
+
+
+def create_engine_and_session(database_url: str, profile: str = "ingest", **kwargs):
     """データベースURLからengineとSessionLocalを作成して返します。"""
-    engine = create_engine(database_url)
+    engine = create_db_engine(database_url, profile, **kwargs)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     return engine, SessionLocal
 
 
+def create_async_engine_and_session(database_url: str, profile: str = "api", **kwargs):
+    """データベースURLから非同期のengineとSessionLocalを作成して返します。"""
+    engine = create_db_engine(database_url, profile, **kwargs)
+    SessionLocal = async_sessionmaker(
+        autocommit=False, autoflush=False, bind=engine, expire_on_commit=False
+    )
+    return engine, SessionLocal
+
+
 def create_tables(db_engine: Engine):
     """データベースにテーブルを作成します。"""
     Base.metadata.create_all(bind=db_engine)
@@ -0,0 +1,44 @@
+import json
+from typing import Iterator
+
+from sqlalchemy import Connection, text
+from sqlalchemy.sql import Executable
+
+
+def explain(conn: Connection, stmt: Executable) -> dict:
+    """SELECT文を値を埋め込んでEXPLAIN (FORMAT JSON)し、最上位のノードを返します。"""
+    compiled = stmt.compile(conn, compile_kwargs={"literal_binds": True})
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def plan_nodes(plan: dict) -> Iterator[dict]:
+    """実行計画のノードを(サブプランを含めて)すべて返します。"""
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        yield node
+        nodes.extend(node.get("Plans", []))
+
+
+def used_indexes(plan: dict) -> set[str]:
+    """実行計画で使われるインデックス名を返します。"""
+    return {node["Index Name"] for node in plan_nodes(plan) if "Index Name" in node}
+
+
+def scanned_tables(plan: dict) -> set[str]:
+    """実行計画で読み込むテーブル名を返します (パーティションは個別の名前になります)。"""
+    return {
+        node["Relation Name"] for node in plan_nodes(plan) if "Relation Name" in node
+    }
+
+
+def seq_scanned_tables(plan: dict) -> set[str]:
+    """実行計画で全件を走査するテーブル名を返します。"""
+    return {
+        node["Relation Name"]
+        for node in plan_nodes(plan)
+        if node["Node Type"] == "Seq Scan"
+    }
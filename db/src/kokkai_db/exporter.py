@@ -0,0 +1,257 @@
+"""
+国会回次ごとの列指向ファイルへの書き出し
+
+meetings・speeches(本文を含む)・最新の要約を、サーバーサイドカーソルで少しずつ読み出して
+国会回次ごとのParquet(またはArrow IPC)ファイルに書き出す。
+出力先は <out>/<テーブル名>/session=<回次>/part-0.parquet の形式。
+
+--incrementalを指定すると、前回の書き出しから変化のあった国会回次だけを書き出す。
+pyarrowが必要 (pip install 'kokkai-db[export]')。
+
+例:
+    kokkai-db-export export --session-from 200 --session-to 217 --incremental
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy import Boolean, Date, DateTime, Integer, and_, func, select
+
+from kokkai_db.database import create_db_engine
+from kokkai_db.schema import LatestSummary, Meeting, Speech, SpeechBody, Summary
+
+STATE_FILE = "_export_state.json"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise SystemExit(
+            "pyarrow is required for export: pip install 'kokkai-db[export]'"
+        ) from e
+    return pa
+
+
+def _queries(session: int) -> dict:
+    """書き出すテーブルごとのSELECT文"""
+    return {
+        "meetings": select(*Meeting.__table__.columns)
+        .where(Meeting.session == session)
+        .order_by(Meeting.issue_id),
+        "speeches": select(*Speech.__table__.columns, SpeechBody.speech)
+        .outerjoin(
+            SpeechBody,
+            and_(
+                Speech.speech_id == SpeechBody.speech_id,
+                SpeechBody.session == session,
+            ),
+        )
+        .where(Speech.session == session)
+        .order_by(Speech.issue_id, Speech.speech_order),
+        "summaries": select(*Summary.__table__.columns)
+        .join(
+            LatestSummary,
+            and_(
+                Summary.issue_id == LatestSummary.issue_id,
+                Summary.model == LatestSummary.model,
+                Summary.prompt_version == LatestSummary.prompt_version,
+            ),
+        )
+        .join(Meeting, Meeting.issue_id == Summary.issue_id)
+        .where(Meeting.session == session)
+        .order_by(Summary.issue_id),
+    }
+
+
+def _arrow_schema(pa, stmt):
+    """SELECT文の列の型からArrowのスキーマを作る"""
+    fields = []
+    for column in stmt.selected_columns:
+        if isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(column.type, Date):
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def session_fingerprints(connection, session_from: int, session_to: int) -> dict:
+    """
+    国会回次ごとの変更検出用の値
+    会議数・発言の集計値・発言と最新の要約の最終更新日時のいずれかが変われば書き出し直す
+    """
+    meetings = connection.execute(
+        select(
+            Meeting.session,
+            func.count(),
+            func.sum(Meeting.speech_count),
+            func.sum(Meeting.total_chars),
+            func.count(LatestSummary.issue_id),
+            func.max(Summary.update_time),
+        )
+        .outerjoin(LatestSummary, Meeting.issue_id == LatestSummary.issue_id)
+        .outerjoin(
+            Summary,
+            and_(
+                Summary.issue_id == LatestSummary.issue_id,
+                Summary.model == LatestSummary.model,
+                Summary.prompt_version == LatestSummary.prompt_version,
+            ),
+        )
+        .where(Meeting.session.between(session_from, session_to))
+        .group_by(Meeting.session)
+    ).all()
+    speeches = dict(
+        connection.execute(
+            select(Speech.session, func.max(Speech.update_time))
+            .where(Speech.session.between(session_from, session_to))
+            .group_by(Speech.session)
+        ).all()
+    )
+    return {
+        str(session): json.dumps(
+            [*values, speeches.get(session)], default=lambda v: v.isoformat()
+        )
+        for session, *values in meetings
+    }
+
+
+def export_session(
+    pa, connection, out: Path, session: int, file_format: str, batch_rows: int
+) -> dict[str, int]:
+    """1つの国会回次の各テーブルを書き出し、書き出した行数を返す"""
+    counts = {}
+    suffix = "parquet" if file_format == "parquet" else "arrow"
+    for table, stmt in _queries(session).items():
+        schema = _arrow_schema(pa, stmt)
+        target = out / table / f"session={session}" / f"part-0.{suffix}"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+
+        if file_format == "parquet":
+            writer = pa.parquet.ParquetWriter(tmp, schema, compression="zstd")
+        else:
+            writer = pa.ipc.new_file(tmp, schema)
+        rows = 0
+        try:
+            # サーバーサイドカーソルでbatch_rows行ずつ読み出す
+            result = connection.execution_options(
+                stream_results=True, yield_per=batch_rows
+            ).execute(stmt)
+            for partition in result.mappings().partitions():
+                batch = pa.RecordBatch.from_pylist(
+                    [dict(row) for row in partition], schema=schema
+                )
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        finally:
+            writer.close()
+        os.replace(tmp, target)
+        counts[table] = rows
+    return counts
+
+
+def export(
+    out: Path,
+    database_url: str,
+    session_from: int,
+    session_to: int,
+    file_format: str,
+    incremental: bool,
+    batch_rows: int,
+):
+    pa = _import_pyarrow()
+    out.mkdir(parents=True, exist_ok=True)
+    state_path = out / STATE_FILE
+    state = json.loads(state_path.read_text()) if state_path.exists() else {}
+
+    engine = create_db_engine(database_url, "ingest", pool_size=1, max_overflow=0)
+    started = time.perf_counter()
+    total_rows = 0
+    with engine.connect() as connection:
+        fingerprints = session_fingerprints(connection, session_from, session_to)
+        connection.rollback()
+        for session_key, fingerprint in sorted(
+            fingerprints.items(), key=lambda item: int(item[0])
+        ):
+            if incremental and state.get(session_key) == fingerprint:
+                continue
+            counts = export_session(
+                pa, connection, out, int(session_key), file_format, batch_rows
+            )
+            connection.rollback()
+            total_rows += sum(counts.values())
+            # 書き出しが終わった回次から記録し、中断しても続きから再開できるようにする
+            state[session_key] = fingerprint
+            state_path.write_text(json.dumps(state, indent=2))
+            print(
+                f"Session {session_key}: "
+                + ", ".join(f"{table}={n}" for table, n in counts.items()),
+                file=sys.stderr,
+            )
+    engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Exported {total_rows} rows in {elapsed:.1f}s "
+        f"({total_rows / elapsed if elapsed else 0:.0f} rows/s) "
+        f"at {datetime.now().isoformat(timespec='seconds')}"
+    )
+
+
+def main(argv: list[str] | None = None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Export meetings, speeches and latest summaries per session"
+    )
+    parser.add_argument("out", type=Path, help="output directory")
+    parser.add_argument("--session-from", type=int, default=1)
+    parser.add_argument("--session-to", type=int, default=9999)
+    parser.add_argument("--format", choices=("parquet", "arrow"), default="parquet")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only export sessions that changed since the last export",
+    )
+    parser.add_argument(
+        "--batch-rows",
+        type=int,
+        default=5000,
+        help="rows fetched per server-side cursor batch (default: 5000)",
+    )
+    parser.add_argument(
+        "--database-url",
+        default=os.environ.get("DATABASE_URL"),
+        help="defaults to the DATABASE_URL environment variable",
+    )
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("DATABASE_URL environment variable not set.")
+    export(
+        args.out,
+        args.database_url,
+        args.session_from,
+        args.session_to,
+        args.format,
+        args.incremental,
+        args.batch_rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import json
+from typing import Iterable
+
+from sqlalchemy import Connection, func, select
+from sqlalchemy.orm import Session
+
+# APIのキャッシュに書き換えを知らせるNOTIFYのチャンネル
+INVALIDATION_CHANNEL = "kokkai_cache_invalidation"
+
+# 無効化の対象 (キーはそれぞれissue_id・issue_id・国会回次)
+MEETINGS = "meetings"
+SPEECHES = "speeches"
+SESSIONS = "sessions"
+
+# NOTIFYのペイロードは8000バイト未満に収める必要があるため、キーを分けて送る
+_KEYS_PER_NOTIFY = 200
+
+
+def notify_invalidation(
+    bind: Connection | Session, kind: str, keys: Iterable[str | int]
+) -> None:
+    """
+    書き換えた行のキーをAPIのキャッシュに通知します。
+    NOTIFYはコミット時に送られるため、書き込みと同じトランザクションで呼び出します。
+    """
+    keys = sorted(set(keys))
+    for i in range(0, len(keys), _KEYS_PER_NOTIFY):
+        payload = json.dumps({"kind": kind, "keys": keys[i : i + _KEYS_PER_NOTIFY]})
+        bind.execute(select(func.pg_notify(INVALIDATION_CHANNEL, payload)))
+
+
+def parse_invalidation(payload: str) -> tuple[str, list[str | int]]:
+    """notify_invalidationのペイロードを(対象, キー)に戻します。"""
+    message = json.loads(payload)
+    return message["kind"], message["keys"]
@@ -0,0 +1,410 @@
+"""
+会議録の一括投入
+
+NDJSON(スクレイパーのフィード出力など)や、NDL APIのレスポンスをそのまま保存したファイル
+(ResponseArchiveMiddlewareの.json.gzなど)を読み込み、COPYで一時テーブルに流し込んでから
+meetings・speeches・speech_bodies・sessionsにまとめて反映する。
+
+例:
+    kokkai-db-load meetings.jsonl sessions.jsonl
+    kokkai-db-load scrape/archive --batch-meetings 5000
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from kokkai_db.database import create_db_engine
+from kokkai_db.invalidation import MEETINGS, SESSIONS, SPEECHES, notify_invalidation
+from kokkai_db.partitions import ensure_session_partitions
+
+MEETING_COLUMNS = (
+    "issue_id",
+    "image_kind",
+    "search_object",
+    "session",
+    "name_of_house",
+    "name_of_meeting",
+    "issue",
+    "date",
+    "closing",
+    "meeting_url",
+    "pdf_url",
+    "speech_count",
+    "total_chars",
+    "speaker_count",
+    "first_speech_order",
+    "last_speech_order",
+)
+SPEECH_COLUMNS = (
+    "issue_id",
+    "speech_id",
+    "session",
+    "speech_order",
+    "speaker",
+    "speaker_yomi",
+    "speaker_group",
+    "speaker_position",
+    "speaker_role",
+    "start_page",
+    "create_time",
+    "update_time",
+    "speech_url",
+)
+SESSION_COLUMNS = ("session", "name", "start_date", "end_date")
+
+# 国会回次一覧API(kaijifp)の名称に含まれる会期 (sessions_spiderと同じ形式)
+_KAIJI_DATES = re.compile(r"\((\d{4})\)年(\d+)月(\d+)日～.*\((\d{4})\)年(\d+)月(\d+)日")
+
+_STAGING_DDL = (
+    "CREATE TEMP TABLE stage_meetings (LIKE meetings INCLUDING DEFAULTS)",
+    "CREATE TEMP TABLE stage_speeches (LIKE speeches INCLUDING DEFAULTS)",
+    "ALTER TABLE stage_speeches ADD COLUMN speech text",
+    "CREATE TEMP TABLE stage_sessions (LIKE sessions)",
+    # 日付を取り出せなかった国会回次も受け取り、反映時に読み飛ばす
+    "ALTER TABLE stage_sessions ALTER COLUMN start_date DROP NOT NULL, "
+    "ALTER COLUMN end_date DROP NOT NULL",
+    "CREATE TEMP TABLE stage_new_meetings (issue_id varchar PRIMARY KEY)",
+)
+
+# 一時テーブルから本テーブルへの反映
+# 既存の会議はそのまま残し、新規に登録した会議の発言だけを書き込む
+_MERGE_SQL = (
+    f"""
+    INSERT INTO sessions ({", ".join(SESSION_COLUMNS)})
+    SELECT DISTINCT ON (session) {", ".join(SESSION_COLUMNS)} FROM stage_sessions
+    WHERE start_date IS NOT NULL AND end_date IS NOT NULL
+    ORDER BY session
+    ON CONFLICT (session) DO UPDATE SET
+        name = excluded.name,
+        start_date = excluded.start_date,
+        end_date = excluded.end_date
+    """,
+    f"""
+    WITH inserted AS (
+        INSERT INTO meetings ({", ".join(MEETING_COLUMNS)})
+        SELECT DISTINCT ON (issue_id) {", ".join(MEETING_COLUMNS)} FROM stage_meetings
+        ORDER BY issue_id
+        ON CONFLICT (issue_id) DO NOTHING
+        RETURNING issue_id
+    )
+    INSERT INTO stage_new_meetings SELECT issue_id FROM inserted
+    """,
+    f"""
+    INSERT INTO speeches ({", ".join(SPEECH_COLUMNS)})
+    SELECT DISTINCT ON (speech_id) {", ".join("s." + c for c in SPEECH_COLUMNS)}
+    FROM stage_speeches s JOIN stage_new_meetings USING (issue_id)
+    ORDER BY speech_id
+    ON CONFLICT (speech_id, session) DO NOTHING
+    """,
+    """
+    INSERT INTO speech_bodies (speech_id, session, speech)
+    SELECT DISTINCT ON (speech_id) s.speech_id, s.session, s.speech
+    FROM stage_speeches s JOIN stage_new_meetings USING (issue_id)
+    WHERE s.speech IS NOT NULL
+    ORDER BY speech_id
+    ON CONFLICT (speech_id, session) DO NOTHING
+    """,
+)
+
+
+@dataclass
+class Batch:
+    """1回のCOPY・反映で扱う行"""
+
+    meetings: list[tuple] = field(default_factory=list)
+    speeches: list[tuple] = field(default_factory=list)
+    sessions: list[tuple] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.meetings) + len(self.sessions)
+
+
+def iter_files(paths: Iterable[str]) -> Iterator[Path]:
+    """指定されたファイルと、ディレクトリ内の.json/.jsonl/.ndjson(.gz)を順に返す"""
+    for path in map(Path, paths):
+        if path.is_dir():
+            for child in sorted(path.rglob("*")):
+                if child.is_file() and _is_data_file(child):
+                    yield child
+        else:
+            yield path
+
+
+def _is_data_file(path: Path) -> bool:
+    name = path.name.removesuffix(".gz")
+    if name.endswith(".meta.json"):
+        # ResponseArchiveMiddlewareのヘッダ情報
+        return False
+    return name.endswith((".json", ".jsonl", ".ndjson"))
+
+
+def iter_documents(path: Path) -> Iterator[dict]:
+    """
+    ファイル内のJSONオブジェクトを返す (1ファイル1オブジェクトまたは1行1オブジェクト)
+    JSONとして読めないファイル・行は警告を出して読み飛ばす
+    """
+    opener = gzip.open if path.suffix == ".gz" else open
+    try:
+        with opener(path, "rt", encoding="utf-8") as f:
+            if path.name.removesuffix(".gz").endswith(".json"):
+                yield json.load(f)
+                return
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    print(f"Skipping {path}:{number}: {e}", file=sys.stderr)
+    except (OSError, ValueError) as e:
+        # gzipでない・UTF-8でない・JSONでないファイル (robots.txtの保存など)
+        print(f"Skipping {path}: {e}", file=sys.stderr)
+
+
+def iter_records(documents: Iterable[dict]) -> Iterator[tuple[str, dict]]:
+    """
+    NDL APIのレスポンス・会議録レコード・国会回次を判別して(種類, レコード)を返す
+    判別できないもの(チェックポイントなど)は読み飛ばす
+    """
+    for doc in documents:
+        if not isinstance(doc, dict):
+            continue
+        if "meetingRecord" in doc:
+            for record in doc["meetingRecord"]:
+                if has_speech_bodies(record):
+                    yield "meeting", record
+        elif "issueID" in doc and "speechRecord" in doc:
+            if has_speech_bodies(doc):
+                yield "meeting", doc
+        elif "start_date" in doc and "session" in doc:
+            yield "session", doc
+        elif isinstance(doc.get("data"), list):
+            # 国会回次一覧API(kaijifp)のレスポンス
+            for entry in doc["data"]:
+                session = kaiji_session(entry)
+                if session is not None:
+                    yield "session", session
+
+
+def has_speech_bodies(record: dict) -> bool:
+    """
+    会議録APIの会議で、すべての発言が本文を持つか
+    会議一覧API(meeting_list)の会議も発言の一覧を持つが本文がないため、
+    読み込むと本文のない発言が登録され、後から読んだ会議録APIの会議が重複として捨てられる
+    """
+    speeches = record.get("speechRecord")
+    return bool(speeches) and all("speech" in speech for speech in speeches)
+
+
+def kaiji_session(entry: dict) -> dict | None:
+    """国会回次一覧APIの1件を国会回次のレコードに変換する (sessions_spiderと同じ解釈)"""
+    code = entry.get("code")
+    name = entry.get("name")
+    if not code or not name:
+        return None
+
+    record = {
+        "session": int(code),
+        "name": " ".join(name.split(" ")[:2]),
+        "start_date": None,
+        "end_date": None,
+    }
+    match = _KAIJI_DATES.search(name)
+    if match:
+        s_year, s_month, s_day, e_year, e_month, e_day = map(int, match.groups())
+        try:
+            record["start_date"] = date(s_year, s_month, s_day)
+            record["end_date"] = date(e_year, e_month, e_day)
+        except ValueError:
+            record["start_date"] = record["end_date"] = None
+    return record
+
+
+def meeting_rows(record: dict) -> tuple[tuple, list[tuple]]:
+    """会議録レコードをmeetings・speechesの行に変換する (集計値もここで計算する)"""
+    speeches = record.get("speechRecord") or []
+    orders = [s["speechOrder"] for s in speeches]
+    meeting = (
+        record["issueID"],
+        record["imageKind"],
+        record["searchObject"],
+        record["session"],
+        record["nameOfHouse"],
+        record.get("nameOfMeeting"),
+        record["issue"],
+        record.get("date") or None,
+        record.get("closing"),
+        record["meetingURL"],
+        record.get("pdfURL"),
+        len(speeches),
+        sum(len(s["speech"]) for s in speeches if s.get("speech")),
+        len({s["speaker"] for s in speeches if s.get("speaker") is not None}),
+        min(orders, default=None),
+        max(orders, default=None),
+    )
+    rows = [
+        (
+            record["issueID"],
+            s["speechID"],
+            record["session"],
+            s["speechOrder"],
+            s.get("speaker"),
+            s.get("speakerYomi"),
+            s.get("speakerGroup"),
+            s.get("speakerPosition"),
+            s.get("speakerRole"),
+            s.get("startPage"),
+            s.get("createTime") or None,
+            s.get("updateTime") or None,
+            s["speechURL"],
+            s.get("speech"),
+        )
+        for s in speeches
+    ]
+    return meeting, rows
+
+
+def iter_batches(records: Iterable[tuple[str, dict]], size: int) -> Iterator[Batch]:
+    batch = Batch()
+    for kind, record in records:
+        if kind == "meeting":
+            meeting, speeches = meeting_rows(record)
+            batch.meetings.append(meeting)
+            batch.speeches.extend(speeches)
+        else:
+            batch.sessions.append(tuple(record.get(c) for c in SESSION_COLUMNS))
+        if len(batch) >= size:
+            yield batch
+            batch = Batch()
+    if len(batch):
+        yield batch
+
+
+def _copy(cursor, table: str, columns: Iterable[str], rows: list[tuple]):
+    if not rows:
+        return
+    with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+def load_batch(connection, batch: Batch) -> dict[str, int]:
+    """
+    1バッチをCOPYで一時テーブルに入れ、本テーブルに反映してコミットする
+    反映した行数をテーブルごとに返す
+    """
+    sessions = {row[3] for row in batch.meetings} | {row[0] for row in batch.sessions}
+    ensure_session_partitions(connection, sessions)
+
+    cursor = connection.connection.driver_connection.cursor()
+    _copy(cursor, "stage_meetings", MEETING_COLUMNS, batch.meetings)
+    _copy(cursor, "stage_speeches", (*SPEECH_COLUMNS, "speech"), batch.speeches)
+    _copy(cursor, "stage_sessions", SESSION_COLUMNS, batch.sessions)
+
+    counts = {}
+    for table, sql in zip(
+        ("sessions", "meetings", "speeches", "speech_bodies"), _MERGE_SQL
+    ):
+        counts[table] = connection.execute(text(sql)).rowcount
+
+    # 登録した会議・国会回次をAPIのキャッシュから取り除く (コミット時に通知される)
+    new_meetings = (
+        connection.execute(text("SELECT issue_id FROM stage_new_meetings"))
+        .scalars()
+        .all()
+    )
+    notify_invalidation(connection, MEETINGS, new_meetings)
+    notify_invalidation(connection, SPEECHES, new_meetings)
+    notify_invalidation(connection, SESSIONS, {row[0] for row in batch.sessions})
+    connection.execute(
+        text(
+            "TRUNCATE stage_meetings, stage_speeches, stage_sessions, "
+            "stage_new_meetings"
+        )
+    )
+    connection.commit()
+    return counts
+
+
+def load(paths: list[str], database_url: str, batch_meetings: int) -> dict[str, int]:
+    engine = create_db_engine(database_url, "ingest", pool_size=1, max_overflow=0)
+    totals = {"read_meetings": 0, "read_speeches": 0}
+    started = time.perf_counter()
+
+    def _records():
+        for path in iter_files(paths):
+            yield from iter_records(iter_documents(path))
+
+    with engine.connect() as connection:
+        for ddl in _STAGING_DDL:
+            connection.execute(text(ddl))
+        connection.commit()
+
+        for batch in iter_batches(_records(), batch_meetings):
+            counts = load_batch(connection, batch)
+            totals["read_meetings"] += len(batch.meetings)
+            totals["read_speeches"] += len(batch.speeches)
+            for table, count in counts.items():
+                totals[table] = totals.get(table, 0) + count
+            elapsed = time.perf_counter() - started
+            print(
+                f"{totals['read_meetings']} meetings, "
+                f"{totals['read_speeches']} speeches read "
+                f"({totals['read_speeches'] / elapsed:.0f} speeches/s)",
+                file=sys.stderr,
+            )
+    engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    inserted = ", ".join(
+        f"{table}={totals.get(table, 0)}"
+        for table in ("sessions", "meetings", "speeches", "speech_bodies")
+    )
+    rows = totals["read_meetings"] + totals["read_speeches"]
+    print(
+        f"Loaded in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s): "
+        f"{inserted}"
+    )
+    return totals
+
+
+def main(argv: list[str] | None = None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Bulk load NDL meeting records into the database with COPY"
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="NDJSON/JSON files or directories (.gz supported)"
+    )
+    parser.add_argument(
+        "--batch-meetings",
+        type=int,
+        default=2000,
+        help="meetings per COPY/merge transaction (default: 2000)",
+    )
+    parser.add_argument(
+        "--database-url",
+        default=os.environ.get("DATABASE_URL"),
+        help="defaults to the DATABASE_URL environment variable",
+    )
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("DATABASE_URL environment variable not set.")
+    load(args.paths, args.database_url, args.batch_meetings)
+
+
+if __name__ == "__main__":
+    main()
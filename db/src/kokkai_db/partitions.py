@@ -0,0 +1,48 @@
+import re
+from typing import Iterable
+
+from sqlalchemy import Connection, text
+from sqlalchemy.orm import Session
+
+# 国会回次(session)でLIST分割しているテーブル
+PARTITIONED_TABLES = ("speeches", "speech_bodies")
+
+_PARTITION_NAME = re.compile(
+    r"^(" + "|".join(PARTITIONED_TABLES) + r")_s\d+$",
+)
+
+
+def partition_name(table: str, session: int) -> str:
+    """国会回次のパーティションのテーブル名を返します。"""
+    return f"{table}_s{int(session)}"
+
+
+def is_partition(table_name: str) -> bool:
+    """ensure_session_partitionsで作成したパーティションのテーブル名か判定します。"""
+    return _PARTITION_NAME.match(table_name) is not None
+
+
+def ensure_session_partitions(
+    bind: Connection | Session, sessions: Iterable[int]
+) -> list[str]:
+    """
+    国会回次のパーティションがなければ作成し、作成したテーブル名を返します。
+    デフォルトパーティションは持たないため、発言を書き込む前に呼び出す必要があります。
+    """
+    created = []
+    for session in sorted({int(s) for s in sessions}):
+        for table in PARTITIONED_TABLES:
+            name = partition_name(table, session)
+            exists = bind.execute(
+                text("SELECT to_regclass(:name)"), {"name": name}
+            ).scalar()
+            if exists is not None:
+                continue
+            bind.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} "
+                    f"PARTITION OF {table} FOR VALUES IN ({session})"
+                )
+            )
+            created.append(name)
+    return created
@@ -2,7 +2,20 @@ from __future__ import annotations
 
 from datetime import date, datetime
 
-from sqlalchemy import Date, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import (
+    Boolean,
+    CheckConstraint,
+    Date,
+    DateTime,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    false,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -16,6 +29,10 @@ class Meeting(Base):
     """
 
     __tablename__ = "meetings"
+    __table_args__ = (
+        # 回次での絞り込み・会議名の一覧、回次+会議名での絞り込み
+        Index("ix_meetings_session_name_of_meeting", "session", "name_of_meeting"),
+    )
 
     issue_id: Mapped[str] = mapped_column(
         String, primary_key=True, unique=True, nullable=False
@@ -30,6 +47,22 @@ class Meeting(Base):
     closing: Mapped[str | None] = mapped_column(String, nullable=True)
     meeting_url: Mapped[str] = mapped_column(String, nullable=False)
     pdf_url: Mapped[str | None] = mapped_column(String, nullable=True)
+    # 発言が訂正され、要約の作り直しが必要か
+    summary_stale: Mapped[bool] = mapped_column(
+        Boolean, nullable=False, default=False, server_default=false()
+    )
+    # 発言の集計値 (取り込み時に更新する)
+    speech_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    total_chars: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    speaker_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    first_speech_order: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    last_speech_order: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
     speeches: Mapped[list[Speech]] = relationship("Speech", back_populates="meeting")
 
@@ -40,26 +73,56 @@ class Speech(Base):
     """
 
     __tablename__ = "speeches"
+    __table_args__ = (
+        # 会議ごとの発言の取得 (発言順での並べ替えを含む)
+        Index("ix_speeches_issue_id_speech_order", "issue_id", "speech_order"),
+        # 国会回次ごとに分割する (パーティションはkokkai_db.partitionsで作成する)
+        {"postgresql_partition_by": "LIST (session)"},
+    )
 
     issue_id: Mapped[str] = mapped_column(
         String, ForeignKey("meetings.issue_id"), nullable=False
     )
-    speech_id: Mapped[str] = mapped_column(
-        String, primary_key=True, unique=True, nullable=False
-    )
+    speech_id: Mapped[str] = mapped_column(String, primary_key=True, nullable=False)
+    # パーティションキー (会議の国会回次)
+    session: Mapped[int] = mapped_column(Integer, primary_key=True, nullable=False)
     speech_order: Mapped[int] = mapped_column(Integer, nullable=False)
     speaker: Mapped[str | None] = mapped_column(String)
     speaker_yomi: Mapped[str | None] = mapped_column(String)
     speaker_group: Mapped[str | None] = mapped_column(String)
     speaker_position: Mapped[str | None] = mapped_column(String)
     speaker_role: Mapped[str | None] = mapped_column(String)
-    speech: Mapped[str | None] = mapped_column(Text)
     start_page: Mapped[int | None] = mapped_column(Integer)
     create_time: Mapped[datetime | None] = mapped_column(DateTime)
     update_time: Mapped[datetime | None] = mapped_column(DateTime)
     speech_url: Mapped[str] = mapped_column(String, nullable=False)
 
     meeting: Mapped[Meeting] = relationship("Meeting", back_populates="speeches")
+    # 本文は必要な場合のみ明示的に取得する (暗黙の遅延読み込みはエラーにする)
+    body: Mapped[SpeechBody | None] = relationship(
+        "SpeechBody", back_populates="speech_meta", uselist=False, lazy="raise"
+    )
+
+
+class SpeechBody(Base):
+    """
+    発言の本文
+    一覧・メタデータの取得で大きな本文を読み込まないよう、speechesから分けて持つ
+    """
+
+    __tablename__ = "speech_bodies"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["speech_id", "session"], ["speeches.speech_id", "speeches.session"]
+        ),
+        {"postgresql_partition_by": "LIST (session)"},
+    )
+
+    speech_id: Mapped[str] = mapped_column(String, primary_key=True, nullable=False)
+    session: Mapped[int] = mapped_column(Integer, primary_key=True, nullable=False)
+    speech: Mapped[str | None] = mapped_column(Text)
+
+    speech_meta: Mapped[Speech] = relationship("Speech", back_populates="body")
 
 
 class Summary(Base):
@@ -68,6 +131,15 @@ class Summary(Base):
     """
 
     __tablename__ = "summaries"
+    __table_args__ = (
+        # 会議ごとの最新の要約の取得
+        Index(
+            "ix_summaries_issue_id_prompt_version_update_time",
+            "issue_id",
+            "prompt_version",
+            "update_time",
+        ),
+    )
 
     issue_id: Mapped[str] = mapped_column(
         String, ForeignKey("meetings.issue_id"), primary_key=True, nullable=False
@@ -79,6 +151,27 @@ class Summary(Base):
     update_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
 
 
+class LatestSummary(Base):
+    """
+    会議ごとの最新の要約 (prompt_versionが最も大きく、その中で最後に更新されたもの)
+    要約の保存時に更新する
+    """
+
+    __tablename__ = "latest_summaries"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["issue_id", "model", "prompt_version"],
+            ["summaries.issue_id", "summaries.model", "summaries.prompt_version"],
+        ),
+    )
+
+    issue_id: Mapped[str] = mapped_column(
+        String, ForeignKey("meetings.issue_id"), primary_key=True, nullable=False
+    )
+    model: Mapped[str] = mapped_column(String, nullable=False)
+    prompt_version: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
 class Session(Base):
     """
     国会回次のマスタ
@@ -90,3 +183,69 @@ class Session(Base):
     name: Mapped[str] = mapped_column(String, nullable=False)
     start_date: Mapped[date] = mapped_column(Date, nullable=False)
     end_date: Mapped[date] = mapped_column(Date, nullable=False)
+
+
+class CrawlWatermark(Base):
+    """
+    院ごとの差分クロールの到達点
+    """
+
+    __tablename__ = "crawl_watermarks"
+
+    name_of_house: Mapped[str] = mapped_column(String, primary_key=True, nullable=False)
+    last_date: Mapped[date | None] = mapped_column(Date, nullable=True)
+    last_session: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    last_update_time: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    update_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class CrawlCheckpoint(Base):
+    """
+    検索条件ごとのページング位置 (中断したクロールの再開用)
+    """
+
+    __tablename__ = "crawl_checkpoints"
+
+    fingerprint: Mapped[str] = mapped_column(String, primary_key=True, nullable=False)
+    params: Mapped[str] = mapped_column(Text, nullable=False)
+    next_record_position: Mapped[int] = mapped_column(Integer, nullable=False)
+    update_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class CrawlShard(Base):
+    """
+    大規模な取得を分割した作業単位
+    複数のスパイダープロセスがpendingのものを1件ずつ取得して処理する
+    """
+
+    __tablename__ = "crawl_shards"
+    __table_args__ = (
+        UniqueConstraint("plan", "params"),
+        CheckConstraint("status IN ('pending', 'claimed', 'done', 'failed')"),
+    )
+
+    shard_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    plan: Mapped[str] = mapped_column(String, nullable=False)
+    # SpeechRequestParamsのJSON (startRecordを含まない)
+    params: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(
+        String, nullable=False, default="pending", server_default="pending"
+    )
+    attempts: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    claimed_by: Mapped[str | None] = mapped_column(String, nullable=True)
+    claimed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class CrawlRateLimit(Base):
+    """
+    ドメインごとの次にリクエストしてよい時刻
+    複数のスパイダープロセスで共有するリクエスト間隔の管理に使う
+    """
+
+    __tablename__ = "crawl_rate_limits"
+
+    domain: Mapped[str] = mapped_column(String, primary_key=True, nullable=False)
+    next_request_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
@@ -5,6 +5,7 @@ from alembic import context
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 
+from kokkai_db.partitions import is_partition
 from kokkai_db.schema import Base
 
 load_dotenv()
@@ -31,6 +32,13 @@ target_metadata = Base.metadata
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """国会回次ごとのパーティションはautogenerateの比較対象から外す"""
+    if type_ == "table" and reflected and is_partition(name):
+        return False
+    return True
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -48,6 +56,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=DATABASE_URL,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -68,7 +77,11 @@ def run_migrations_online() -> None:
     connectable = create_engine(DATABASE_URL)
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
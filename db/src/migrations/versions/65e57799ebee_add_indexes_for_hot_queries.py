@@ -0,0 +1,34 @@
+"""add indexes for hot queries
+
+Revision ID: 65e57799ebee
+Revises: 77e04ab39ba3
+Create Date: 2026-10-17 16:03:18.540217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '65e57799ebee'
+down_revision: Union[str, Sequence[str], None] = '77e04ab39ba3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 稼働中のテーブルをロックしないよう、トランザクション外でCONCURRENTLYに作成する
+    with op.get_context().autocommit_block():
+        op.create_index('ix_meetings_session_name_of_meeting', 'meetings', ['session', 'name_of_meeting'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_speeches_issue_id_speech_order', 'speeches', ['issue_id', 'speech_order'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_summaries_issue_id_prompt_version_update_time', 'summaries', ['issue_id', 'prompt_version', 'update_time'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_summaries_issue_id_prompt_version_update_time', table_name='summaries', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_speeches_issue_id_speech_order', table_name='speeches', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_meetings_session_name_of_meeting', table_name='meetings', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,119 @@
+import gzip
+import json
+import os
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from kokkai_db.loader import (
+    _STAGING_DDL,
+    SESSION_COLUMNS,
+    _copy,
+    iter_batches,
+    iter_documents,
+    iter_records,
+)
+from kokkai_db.schema import Base
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+KAIJIFP = {
+    "data": [
+        {
+            "code": "217",
+            "name": "第217回 常会 令和7(2025)年1月24日～令和7(2025)年6月22日",
+        },
+        {"code": "218", "name": "第218回 臨時会"},
+        {"code": "", "name": "すべて"},
+    ]
+}
+
+# 会議一覧API(meeting_list)のレスポンス: 発言の一覧はあるが本文がない
+MEETING_LIST = {
+    "numberOfRecords": 1,
+    "meetingRecord": [
+        {
+            "issueID": "121705261X00120250124",
+            "session": 217,
+            "nameOfHouse": "衆議院",
+            "speechRecord": [
+                {
+                    "speechID": "121705261X00120250124_000",
+                    "speechOrder": 0,
+                    "speaker": "会議録情報",
+                    "speechURL": "https://kokkai.ndl.go.jp/txt/121705261X00120250124/0",
+                }
+            ],
+        }
+    ],
+}
+
+
+def test_iter_records_skips_meeting_list_response():
+    meeting = json.loads(json.dumps(MEETING_LIST["meetingRecord"][0]))
+    meeting["speechRecord"][0]["speech"] = "○議長　これより会議を開きます。"
+    meeting_response = {"numberOfRecords": 1, "meetingRecord": [meeting]}
+
+    # 会議一覧を先に読んでも、本文のある会議録APIの会議だけを返す
+    records = list(iter_records([MEETING_LIST, meeting_response]))
+
+    assert records == [("meeting", meeting)]
+    assert list(iter_records(MEETING_LIST["meetingRecord"])) == []
+
+
+def test_iter_records_reads_kaijifp_response():
+    sessions = [record for kind, record in iter_records([KAIJIFP]) if kind == "session"]
+
+    assert sessions == [
+        {
+            "session": 217,
+            "name": "第217回 常会",
+            "start_date": date(2025, 1, 24),
+            "end_date": date(2025, 6, 22),
+        },
+        {
+            "session": 218,
+            "name": "第218回 臨時会",
+            "start_date": None,
+            "end_date": None,
+        },
+    ]
+
+
+def test_iter_documents_skips_undecodable_files(tmp_path, capsys):
+    # ResponseArchiveMiddlewareが以前保存していたrobots.txt
+    robots = tmp_path / "robots.json.gz"
+    robots.write_bytes(gzip.compress(b"User-agent: *\nDisallow: /\n"))
+    kaijifp = tmp_path / "kaijifp.json.gz"
+    kaijifp.write_bytes(gzip.compress(json.dumps(KAIJIFP).encode()))
+    lines = tmp_path / "sessions.jsonl"
+    lines.write_text('{"session": 1}\nnot json\n{"session": 2}\n')
+
+    assert list(iter_documents(robots)) == []
+    assert list(iter_documents(kaijifp)) == [KAIJIFP]
+    assert list(iter_documents(lines)) == [{"session": 1}, {"session": 2}]
+    err = capsys.readouterr().err
+    assert f"Skipping {robots}" in err
+    assert f"Skipping {lines}:2" in err
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+def test_sessions_without_dates_are_staged():
+    (batch,) = iter_batches(iter_records([KAIJIFP]), 10)
+
+    engine = create_engine(TEST_DATABASE_URL)
+    with engine.connect() as conn:
+        trans = conn.begin()
+        Base.metadata.create_all(conn)
+        for ddl in _STAGING_DDL:
+            conn.execute(text(ddl))
+        cursor = conn.connection.driver_connection.cursor()
+        _copy(cursor, "stage_sessions", SESSION_COLUMNS, batch.sessions)
+
+        staged = conn.execute(
+            text("SELECT session, start_date FROM stage_sessions ORDER BY session")
+        ).all()
+        assert staged == [(217, date(2025, 1, 24)), (218, None)]
+        trans.rollback()
+    engine.dispose()
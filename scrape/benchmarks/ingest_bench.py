@@ -0,0 +1,214 @@
+"""
+取り込み処理(検証→INSERTパラメータへの変換)のスループット計測
+
+NDL APIの/api/meetingと同じ形のレスポンスを合成し、DBに書き込まずに以下を比べる
+    legacy:  検証済みモデルをMeetingItem/SpeechItemにコピーしてItemAdapter経由で変換 (以前の実装)
+    current: 検証済みのMeetingRecordをそのまま変換 (DatabasePipeline._meeting_row/_speech_rows)
+
+例 (scrape/で実行):
+    python -m benchmarks.ingest_bench --pages 50 --speeches 200
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+import scrapy
+from itemadapter import ItemAdapter
+
+# パイプラインの読み込みにDATABASE_URLが必要だが、このベンチマークでは接続しない
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg://bench@localhost/bench")
+
+from scraper.pipelines import DatabasePipeline  # noqa: E402
+from scraper.schemas import NdlApiResponse  # noqa: E402
+
+
+class SpeechItem(scrapy.Item):
+    speechID = scrapy.Field()
+    speechOrder = scrapy.Field()
+    speaker = scrapy.Field()
+    speakerYomi = scrapy.Field()
+    speakerGroup = scrapy.Field()
+    speakerPosition = scrapy.Field()
+    speakerRole = scrapy.Field()
+    speech = scrapy.Field()
+    startPage = scrapy.Field()
+    createTime = scrapy.Field()
+    updateTime = scrapy.Field()
+    speechURL = scrapy.Field()
+
+
+class MeetingItem(scrapy.Item):
+    issueID = scrapy.Field()
+    imageKind = scrapy.Field()
+    searchObject = scrapy.Field()
+    session = scrapy.Field()
+    nameOfHouse = scrapy.Field()
+    nameOfMeeting = scrapy.Field()
+    issue = scrapy.Field()
+    date = scrapy.Field()
+    closing = scrapy.Field()
+    speechRecord = scrapy.Field()
+    meetingURL = scrapy.Field()
+    pdfURL = scrapy.Field()
+
+
+def make_page(rng: random.Random, page: int, meetings: int, speeches: int) -> bytes:
+    """/api/meetingの1ページ分のレスポンスを合成する"""
+    records = []
+    for m in range(meetings):
+        issue_id = f"1{page:05d}{m:04d}X00000"[:21]
+        records.append(
+            {
+                "issueID": issue_id,
+                "imageKind": "会議録",
+                "searchObject": 0,
+                "session": 200 + page % 20,
+                "nameOfHouse": "衆議院",
+                "nameOfMeeting": "予算委員会",
+                "issue": f"第{m + 1}号",
+                "date": f"2020-{1 + m % 12:02d}-{1 + m % 28:02d}",
+                "closing": None,
+                "meetingURL": f"https://kokkai.ndl.go.jp/txt/{issue_id}",
+                "pdfURL": None,
+                "speechRecord": [
+                    {
+                        "speechID": f"{issue_id}_{s:03d}",
+                        "speechOrder": s,
+                        "speaker": f"議員{rng.randrange(50)}",
+                        "speakerYomi": "ぎいん",
+                        "speakerGroup": "会派",
+                        "speakerPosition": None,
+                        "speakerRole": None,
+                        "speech": "発言" * rng.randrange(50, 500),
+                        "startPage": 1 + s // 10,
+                        "createTime": "2020-01-01 00:00:00",
+                        "updateTime": "2020-01-02 00:00:00",
+                        "speechURL": f"https://kokkai.ndl.go.jp/txt/{issue_id}/{s}",
+                    }
+                    for s in range(speeches)
+                ],
+            }
+        )
+    return json.dumps(
+        {
+            "numberOfRecords": meetings,
+            "numberOfReturn": meetings,
+            "startRecord": 1,
+            "nextRecordPosition": None,
+            "meetingRecord": records,
+        },
+        ensure_ascii=False,
+    ).encode()
+
+
+def convert_legacy(record) -> tuple[dict, list[dict]]:
+    meeting_item = MeetingItem()
+    for field in meeting_item.fields:
+        if hasattr(record, field):
+            meeting_item[field] = getattr(record, field)
+    speech_items = []
+    for speech_record in record.speechRecord:
+        speech_item = SpeechItem()
+        for field in speech_item.fields:
+            if hasattr(speech_record, field):
+                speech_item[field] = getattr(speech_record, field)
+        speech_items.append(speech_item)
+    meeting_item["speechRecord"] = speech_items
+
+    adapter = ItemAdapter(meeting_item)
+    meeting = {
+        "issue_id": adapter.get("issueID"),
+        "image_kind": adapter.get("imageKind"),
+        "search_object": adapter.get("searchObject"),
+        "session": adapter.get("session"),
+        "name_of_house": adapter.get("nameOfHouse"),
+        "name_of_meeting": adapter.get("nameOfMeeting"),
+        "issue": adapter.get("issue"),
+        "date": adapter.get("date"),
+        "closing": adapter.get("closing"),
+        "meeting_url": adapter.get("meetingURL"),
+        "pdf_url": adapter.get("pdfURL"),
+    }
+    rows = []
+    for speech_item in adapter.get("speechRecord", []):
+        speech_adapter = ItemAdapter(speech_item)
+        rows.append(
+            {
+                "issue_id": meeting["issue_id"],
+                "speech_id": speech_adapter.get("speechID"),
+                "session": meeting["session"],
+                "speech_order": speech_adapter.get("speechOrder"),
+                "speaker": speech_adapter.get("speaker"),
+                "speaker_yomi": speech_adapter.get("speakerYomi"),
+                "speaker_group": speech_adapter.get("speakerGroup"),
+                "speaker_position": speech_adapter.get("speakerPosition"),
+                "speaker_role": speech_adapter.get("speakerRole"),
+                "speech": speech_adapter.get("speech"),
+                "start_page": speech_adapter.get("startPage"),
+                "create_time": speech_adapter.get("createTime"),
+                "update_time": speech_adapter.get("updateTime"),
+                "speech_url": speech_adapter.get("speechURL"),
+            }
+        )
+    return meeting, rows
+
+
+def convert_current(record) -> tuple[dict, list[dict]]:
+    return DatabasePipeline._meeting_row(record), DatabasePipeline._speech_rows(record)
+
+
+def run(pages: list[bytes], convert) -> tuple[float, float, int]:
+    """(検証の秒数, 変換の秒数, 発言数)を返す"""
+    validate = 0.0
+    conversion = 0.0
+    speeches = 0
+    for body in pages:
+        started = time.perf_counter()
+        data = NdlApiResponse.model_validate_json(body)
+        validate += time.perf_counter() - started
+
+        started = time.perf_counter()
+        for record in data.meetingRecord:
+            _, rows = convert(record)
+            DatabasePipeline._split_bodies(rows)
+            speeches += len(rows)
+        conversion += time.perf_counter() - started
+    return validate, conversion, speeches
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--meetings", type=int, default=10, help="meetings per page")
+    parser.add_argument("--speeches", type=int, default=200, help="per meeting")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    pages = [
+        make_page(rng, page, args.meetings, args.speeches) for page in range(args.pages)
+    ]
+    print(
+        f"{args.pages} pages x {args.meetings} meetings x {args.speeches} speeches "
+        f"({sum(map(len, pages)) / 1e6:.1f} MB), best of {args.repeat}"
+    )
+    for name, convert in (("legacy", convert_legacy), ("current", convert_current)):
+        results = [run(pages, convert) for _ in range(args.repeat)]
+        validate = min(r[0] for r in results)
+        conversion = min(r[1] for r in results)
+        speeches = results[0][2]
+        median = statistics.median(r[0] + r[1] for r in results)
+        print(
+            f"{name:>8}: validate {validate:.3f}s, convert {conversion:.3f}s, "
+            f"{speeches / (validate + conversion):,.0f} speeches/s "
+            f"(median total {median:.3f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
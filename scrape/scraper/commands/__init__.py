@@ -0,0 +1,2 @@
+# Custom scrapy commands for the scraper project.
+# See https://docs.scrapy.org/en/latest/topics/commands.html#custom-project-commands
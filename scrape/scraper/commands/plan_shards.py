@@ -0,0 +1,133 @@
+import calendar
+from datetime import date
+
+from kokkai_db.database import create_engine_and_session
+from kokkai_db.schema import CrawlShard
+from pydantic import ValidationError
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from sqlalchemy.dialects.postgresql import insert
+
+from scraper.schemas import SpeechRequestParams
+from scraper.settings import DATABASE_URL
+
+
+def _month_ranges(start: date, end: date):
+    """start〜endを月ごとの(開始日, 終了日)に分割する"""
+    current = start
+    while current <= end:
+        last_day = calendar.monthrange(current.year, current.month)[1]
+        month_end = min(date(current.year, current.month, last_day), end)
+        yield current, month_end
+        if current.month == 12:
+            current = date(current.year + 1, 1, 1)
+        else:
+            current = date(current.year, current.month + 1, 1)
+
+
+class Command(ScrapyCommand):
+    """
+    取得範囲を国会回次ごと・月ごとの作業単位に分割してcrawl_shardsに登録する
+
+    例:
+        scrapy plan_shards backfill --by session --session-from 150 --session-to 217
+        scrapy crawl meetings_spider -a plan=backfill -s GLOBAL_RATE_LIMIT_ENABLED=True
+    """
+
+    requires_project = True
+
+    def syntax(self):
+        return "<plan> [options]"
+
+    def short_desc(self):
+        return "Split a meeting crawl into shards that spiders can claim"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--by",
+            choices=("session", "month"),
+            default="session",
+            help="shard granularity (default: session)",
+        )
+        parser.add_argument("--session-from", type=int, help="first Diet session")
+        parser.add_argument("--session-to", type=int, help="last Diet session")
+        parser.add_argument("--from", dest="from_", help="first date (YYYY-MM-DD)")
+        parser.add_argument("--until", help="last date (YYYY-MM-DD)")
+        parser.add_argument("--name-of-house", help="nameOfHouse filter")
+        parser.add_argument("--name-of-meeting", help="nameOfMeeting filter")
+        parser.add_argument(
+            "--maximum-records", type=int, default=10, help="records per page"
+        )
+
+    def _shard_params(self, opts) -> list[dict]:
+        if opts.by == "session":
+            if opts.session_from is None or opts.session_to is None:
+                raise UsageError("--by session requires --session-from/--session-to")
+            return [
+                {
+                    "sessionFrom": s,
+                    "sessionTo": s,
+                    "from": opts.from_,
+                    "until": opts.until,
+                }
+                for s in range(opts.session_from, opts.session_to + 1)
+            ]
+
+        if opts.from_ is None or opts.until is None:
+            raise UsageError("--by month requires --from/--until")
+        try:
+            start = date.fromisoformat(opts.from_)
+            end = date.fromisoformat(opts.until)
+        except ValueError as e:
+            raise UsageError(f"Invalid date: {e}")
+        return [
+            {
+                "from": month_start.isoformat(),
+                "until": month_end.isoformat(),
+                "sessionFrom": opts.session_from,
+                "sessionTo": opts.session_to,
+            }
+            for month_start, month_end in _month_ranges(start, end)
+        ]
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError("A plan name is required")
+        plan = args[0]
+
+        rows = []
+        for shard in self._shard_params(opts):
+            try:
+                params = SpeechRequestParams(
+                    **shard,
+                    nameOfHouse=opts.name_of_house,
+                    nameOfMeeting=opts.name_of_meeting,
+                    maximumRecords=opts.maximum_records,
+                )
+            except ValidationError as e:
+                raise UsageError(f"Invalid shard parameters: {e}")
+            rows.append(
+                {
+                    "plan": plan,
+                    # startRecordはチェックポイントで管理するため含めない
+                    "params": params.model_dump_json(
+                        by_alias=True, exclude_none=True, exclude={"startRecord"}
+                    ),
+                }
+            )
+
+        _, SessionLocal = create_engine_and_session(DATABASE_URL)
+        with SessionLocal() as session:
+            result = session.execute(
+                insert(CrawlShard)
+                .on_conflict_do_nothing(index_elements=["plan", "params"])
+                .returning(CrawlShard.shard_id),
+                rows,
+            )
+            created = len(result.all())
+            session.commit()
+        print(
+            f"Plan {plan}: {created} shards created "
+            f"({len(rows) - created} already planned)"
+        )
@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet.task import LoopingCall
+
+# レイテンシのヒストグラムの境界 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class StageHistogram:
+    """1つの処理段階のレイテンシ分布と件数・バイト数"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.records = 0
+        self.bytes = 0
+
+    def observe(self, seconds: float, records: int = 0, nbytes: int = 0):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.records += records
+        self.bytes += nbytes
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_seconds": self.sum,
+            "mean_seconds": self.sum / self.count if self.count else 0.0,
+            "max_seconds": self.max,
+            "records": self.records,
+            "bytes": self.bytes,
+            "buckets": {
+                str(le): c for le, c in zip((*self.buckets, "+Inf"), self.counts)
+            },
+        }
+
+
+class CrawlMetrics:
+    """
+    クロールの処理段階ごとのレイテンシ・件数・バイト数を集計する拡張
+
+    段階の例:
+        - download: NDL APIからのダウンロード
+        - validate: NdlApiResponse等によるレスポンスの検証
+        - parse: スパイダーのコールバック全体
+        - convert: パイプラインでのINSERTパラメータへの変換
+        - db_commit: DBへの書き込み
+
+    CRAWL_METRICS_INTERVAL秒ごとにPrometheusのtextfile形式で書き出し、
+    スパイダー終了時にJSONのサマリを書き出す
+    """
+
+    def __init__(
+        self,
+        prometheus_file: str | None,
+        json_file: str | None,
+        interval: float,
+    ):
+        self.prometheus_file = prometheus_file
+        self.json_file = json_file
+        self.interval = interval
+        self.stages: dict[str, StageHistogram] = {}
+        # DB書き込みスレッドからも記録されるためロックする
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.spider_name = ""
+        self.export_loop: LoopingCall | None = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("CRAWL_METRICS_ENABLED"):
+            raise NotConfigured
+        ext = cls(
+            settings.get("CRAWL_METRICS_PROMETHEUS_FILE"),
+            settings.get("CRAWL_METRICS_JSON_FILE"),
+            settings.getfloat("CRAWL_METRICS_INTERVAL", 60),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def observe(self, stage: str, seconds: float, records: int = 0, nbytes: int = 0):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = StageHistogram()
+            histogram.observe(seconds, records, nbytes)
+
+    def spider_opened(self, spider):
+        self.spider_name = spider.name
+        self.started = time.time()
+        if self.prometheus_file:
+            self.export_loop = LoopingCall(self.write_prometheus)
+            self.export_loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.export_loop and self.export_loop.running:
+            self.export_loop.stop()
+        if self.prometheus_file:
+            self.write_prometheus()
+        if self.json_file:
+            self.write_json(reason)
+
+    def snapshot(self) -> dict[str, dict]:
+        with self.lock:
+            return {stage: h.to_dict() for stage, h in self.stages.items()}
+
+    def write_prometheus(self):
+        lines = []
+        labels = f'spider="{self.spider_name}"'
+        snapshot = self.snapshot()
+        for name, kind in (
+            ("scraper_stage_seconds", "histogram"),
+            ("scraper_stage_records_total", "counter"),
+            ("scraper_stage_bytes_total", "counter"),
+        ):
+            lines.append(f"# TYPE {name} {kind}")
+            for stage, h in snapshot.items():
+                stage_labels = f'{labels},stage="{stage}"'
+                if kind == "histogram":
+                    cumulative = 0
+                    for le, count in h["buckets"].items():
+                        cumulative += count
+                        lines.append(
+                            f'{name}_bucket{{{stage_labels},le="{le}"}} {cumulative}'
+                        )
+                    lines.append(f"{name}_sum{{{stage_labels}}} {h['sum_seconds']}")
+                    lines.append(f"{name}_count{{{stage_labels}}} {h['count']}")
+                elif name == "scraper_stage_records_total":
+                    lines.append(f"{name}{{{stage_labels}}} {h['records']}")
+                else:
+                    lines.append(f"{name}{{{stage_labels}}} {h['bytes']}")
+        _write_atomic(self.prometheus_file, "\n".join(lines) + "\n")
+
+    def write_json(self, reason: str):
+        summary = {
+            "spider": self.spider_name,
+            "reason": reason,
+            "started": self.started,
+            "elapsed_seconds": time.time() - self.started,
+            "stages": self.snapshot(),
+        }
+        _write_atomic(self.json_file, json.dumps(summary, indent=2))
+
+
+def _write_atomic(path: str, text: str):
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, target)
+
+
+def get_crawl_metrics(crawler) -> CrawlMetrics | None:
+    """有効な場合はCrawlMetrics拡張を返す"""
+    if crawler is None:
+        return None
+    return crawler.get_extension(CrawlMetrics)
@@ -1,37 +1,19 @@
 import scrapy
 
 
-class SpeechItem(scrapy.Item):
-    speechID = scrapy.Field()
-    speechOrder = scrapy.Field()
-    speaker = scrapy.Field()
-    speakerYomi = scrapy.Field()
-    speakerGroup = scrapy.Field()
-    speakerPosition = scrapy.Field()
-    speakerRole = scrapy.Field()
-    speech = scrapy.Field()
-    startPage = scrapy.Field()
-    createTime = scrapy.Field()
-    updateTime = scrapy.Field()
-    speechURL = scrapy.Field()
-
-
-class MeetingItem(scrapy.Item):
-    issueID = scrapy.Field()
-    imageKind = scrapy.Field()
-    searchObject = scrapy.Field()
-    session = scrapy.Field()
-    nameOfHouse = scrapy.Field()
-    nameOfMeeting = scrapy.Field()
-    issue = scrapy.Field()
-    date = scrapy.Field()
-    closing = scrapy.Field()
-    speechRecord = scrapy.Field()  # List of SpeechItem
-    meetingURL = scrapy.Field()
-    pdfURL = scrapy.Field()
-
 class SessionItem(scrapy.Item):
     session = scrapy.Field()
     name = scrapy.Field()
     start_date = scrapy.Field()
     end_date = scrapy.Field()
+
+
+class CheckpointItem(scrapy.Item):
+    fingerprint = scrapy.Field()
+    params = scrapy.Field()
+    nextRecordPosition = scrapy.Field()  # Noneの場合は最終ページまで取得済み
+
+
+class ShardItem(scrapy.Item):
+    shard_id = scrapy.Field()
+    status = scrapy.Field()
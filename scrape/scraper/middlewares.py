@@ -3,96 +3,351 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-# useful for handling different item types with a single interface
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import urlparse
+
+from kokkai_db.database import create_engine_and_session
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers, Request
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.defer import deferred_to_future
+from sqlalchemy import text
+from twisted.internet import threads
+from twisted.internet.task import deferLater
+from w3lib.url import canonicalize_url
+
+from .extensions import CrawlMetrics, get_crawl_metrics
 
 
-class ScraperSpiderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the spider middleware does not modify the
-    # passed objects.
+class StageMetricsSpiderMiddleware:
+    """
+    スパイダーのコールバック(parse)の処理時間と出力件数をCrawlMetricsに記録する
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.metrics: CrawlMetrics | None = None
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        s = cls(crawler)
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
         return s
 
-    def process_spider_input(self, response, spider):
-        # Called for each response that goes through the spider
-        # middleware and into the spider.
-
-        # Should return None or raise an exception.
-        return None
-
     def process_spider_output(self, response, result, spider):
-        # Called with the results returned from the Spider, after
-        # it has processed the response.
+        if self.metrics is None:
+            yield from result
+            return
 
-        # Must return an iterable of Request, or item objects.
-        for i in result:
+        # コールバックの実行時間のみを計測し、下流の処理時間は含めない
+        elapsed = 0.0
+        records = 0
+        iterator = iter(result)
+        while True:
+            started = time.perf_counter()
+            try:
+                i = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                break
+            elapsed += time.perf_counter() - started
+            if not isinstance(i, Request):
+                records += 1
             yield i
+        self.metrics.observe("parse", elapsed, records=records)
 
-    def process_spider_exception(self, response, exception, spider):
-        # Called when a spider or process_spider_input() method
-        # (from other spider middleware) raises an exception.
-
-        # Should return either None or an iterable of Request or item objects.
-        pass
-
-    async def process_start(self, start):
-        # Called with an async iterator over the spider start() method or the
-        # maching method of an earlier spider middleware.
-        async for item_or_request in start:
-            yield item_or_request
+    async def process_spider_output_async(self, response, result, spider):
+        async for i in result:
+            yield i
 
     def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        self.metrics = get_crawl_metrics(self.crawler)
+
 
+class StageMetricsDownloaderMiddleware:
+    """
+    ダウンロードのレイテンシと受信バイト数をCrawlMetricsに記録する
+    """
 
-class ScraperDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.metrics: CrawlMetrics | None = None
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        s = cls(crawler)
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
         return s
 
-    def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
-        return None
+    def process_response(self, request, response, spider):
+        latency = request.meta.get("download_latency")
+        if self.metrics is not None and latency is not None:
+            self.metrics.observe(
+                "download", latency, records=1, nbytes=len(response.body)
+            )
+        return response
+
+    def spider_opened(self, spider):
+        self.metrics = get_crawl_metrics(self.crawler)
+
+
+class AdaptiveDelayMiddleware:
+    """
+    レスポンスの状況に応じてダウンロード間隔を調整する
+
+    - 429/503等の応答や通信エラー時は間隔をADAPTIVE_DELAY_BACKOFF倍にし、
+      Retry-Afterヘッダがあればその秒数以上あける
+    - 正常な応答ではレイテンシに合わせて間隔を徐々に近づける
+    間隔はADAPTIVE_DELAY_MIN〜ADAPTIVE_DELAY_MAXの範囲に収める
+    ただしRetry-Afterで指定された秒数はADAPTIVE_DELAY_MAXを超えても守る
+    リクエストの再試行自体はRetryMiddlewareに任せる
+    """
+
+    def __init__(
+        self,
+        crawler,
+        min_delay: float,
+        max_delay: float,
+        backoff: float,
+        latency_factor: float,
+        throttle_codes: list[int | str],
+    ):
+        self.crawler = crawler
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        # -sで渡された値は文字列になるため、response.statusと比べられるよう整数にする
+        self.throttle_codes = {int(code) for code in throttle_codes}
+        self.stats = crawler.stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_DELAY_ENABLED"):
+            raise NotConfigured
+        return cls(
+            crawler,
+            min_delay=settings.getfloat("ADAPTIVE_DELAY_MIN", 0.25),
+            max_delay=settings.getfloat("ADAPTIVE_DELAY_MAX", 60),
+            backoff=settings.getfloat("ADAPTIVE_DELAY_BACKOFF", 2),
+            latency_factor=settings.getfloat("ADAPTIVE_DELAY_LATENCY_FACTOR", 1),
+            throttle_codes=settings.getlist(
+                "ADAPTIVE_DELAY_THROTTLE_CODES", [429, 500, 502, 503, 504]
+            ),
+        )
+
+    def _slot(self, request):
+        key = request.meta.get("download_slot")
+        if key is None:
+            return None
+        return self.crawler.engine.downloader.slots.get(key)
+
+    def _set_delay(self, slot, delay: float, floor: float = 0.0):
+        slot.delay = max(floor, min(self.max_delay, max(self.min_delay, delay)))
+        self.stats.set_value("adaptive_delay/current", slot.delay)
+
+    @staticmethod
+    def _retry_after(response) -> float | None:
+        value = response.headers.get(b"Retry-After")
+        if not value:
+            return None
+        value = value.decode("latin-1").strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def _back_off(self, slot, retry_after: float | None = None):
+        delay = max(slot.delay, self.min_delay) * self.backoff
+        self._set_delay(slot, delay, floor=retry_after or 0.0)
+        self.stats.inc_value("adaptive_delay/backoff_count")
 
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
+        slot = self._slot(request)
+        if slot is None:
+            return response
+
+        if response.status in self.throttle_codes:
+            retry_after = self._retry_after(response)
+            self._back_off(slot, retry_after)
+            spider.logger.info(
+                f"Throttled ({response.status}), download delay is now "
+                f"{slot.delay:.2f}s (Retry-After: {retry_after})"
+            )
+            return response
 
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            # 現在の間隔とレイテンシに応じた目標値の中間に寄せる
+            target = latency * self.latency_factor
+            self._set_delay(slot, (slot.delay + target) / 2)
         return response
 
     def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+        slot = self._slot(request)
+        if slot is not None:
+            self._back_off(slot)
+        return None
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
 
-    def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+class ResponseArchiveMiddleware:
+    """
+    APIのレスポンスをローカルに圧縮保存し、ネットワークを使わずに再生する
+
+    RESPONSE_ARCHIVE_MODE
+        - "record": 200のJSONのレスポンスをRESPONSE_ARCHIVE_DIRに保存する (robots.txtなどは保存しない)
+        - "replay": 保存済みのレスポンスを返し、未保存のリクエストは無視する
+    """
+
+    # 保存時に既に展開済みのため、再生時に引き継がないヘッダ
+    _dropped_headers = (b"Content-Encoding", b"Content-Length", b"Transfer-Encoding")
+
+    def __init__(self, archive_dir: str, mode: str, stats):
+        self.archive_dir = Path(archive_dir)
+        self.mode = mode
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mode = crawler.settings.get("RESPONSE_ARCHIVE_MODE")
+        if not mode:
+            raise NotConfigured
+        if mode not in ("record", "replay"):
+            raise NotConfigured(f"Unknown RESPONSE_ARCHIVE_MODE: {mode}")
+        return cls(
+            crawler.settings.get("RESPONSE_ARCHIVE_DIR", "archive"),
+            mode,
+            crawler.stats,
+        )
+
+    @staticmethod
+    def archive_key(url: str) -> str:
+        return hashlib.sha1(canonicalize_url(url).encode()).hexdigest()
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key = self.archive_key(url)
+        directory = self.archive_dir / key[:2]
+        return directory / f"{key}.json.gz", directory / f"{key}.meta.json"
+
+    def process_request(self, request, spider):
+        if self.mode != "replay":
+            return None
+
+        body_path, meta_path = self._paths(request.url)
+        if not body_path.exists() or not meta_path.exists():
+            self.stats.inc_value("response_archive/miss")
+            raise IgnoreRequest(f"Not in response archive: {request.url}")
+
+        meta = json.loads(meta_path.read_text())
+        body = gzip.decompress(body_path.read_bytes())
+        headers = Headers(meta.get("headers", {}))
+        response_cls = responsetypes.from_args(headers=headers, url=request.url)
+        self.stats.inc_value("response_archive/hit")
+        request.meta["response_archive_replayed"] = True
+        return response_cls(
+            url=request.url,
+            status=meta.get("status", 200),
+            headers=headers,
+            body=body,
+            request=request,
+        )
+
+    def process_response(self, request, response, spider):
+        if (
+            self.mode != "record"
+            or response.status != 200
+            or request.meta.get("response_archive_replayed")
+        ):
+            return response
+        if b"json" not in response.headers.get(b"Content-Type", b"").lower():
+            self.stats.inc_value("response_archive/skipped")
+            return response
+
+        body_path, meta_path = self._paths(request.url)
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        headers = {
+            key.decode(): [v.decode("latin-1") for v in values]
+            for key, values in response.headers.items()
+            if key not in self._dropped_headers
+        }
+        meta = {"url": request.url, "status": response.status, "headers": headers}
+        # 書き込み途中のファイルを再生しないよう、一時ファイルから置き換える
+        tmp_body = body_path.with_suffix(".tmp")
+        tmp_body.write_bytes(gzip.compress(response.body))
+        os.replace(tmp_body, body_path)
+        tmp_meta = meta_path.with_suffix(".tmp")
+        tmp_meta.write_text(json.dumps(meta, ensure_ascii=False))
+        os.replace(tmp_meta, meta_path)
+        self.stats.inc_value("response_archive/stored")
+        self.stats.inc_value("response_archive/stored_bytes", len(response.body))
+        return response
+
+
+class GlobalRateLimitMiddleware:
+    """
+    複数プロセスで同じドメインにアクセスする場合に、DBを介して全体のリクエスト間隔を守る
+
+    crawl_rate_limitsにドメインごとの次にリクエストしてよい時刻を持ち、
+    リクエストのたびにGLOBAL_REQUEST_INTERVAL秒分の枠を予約して、その時刻まで待つ
+    予約は1文のUPSERTで行うため、同時に予約したプロセス同士でも枠は重ならない
+    """
+
+    _reserve_sql = text(
+        """
+        INSERT INTO crawl_rate_limits (domain, next_request_at)
+        VALUES (:domain, localtimestamp + make_interval(secs => :interval))
+        ON CONFLICT (domain) DO UPDATE SET next_request_at =
+            greatest(crawl_rate_limits.next_request_at, localtimestamp)
+            + make_interval(secs => :interval)
+        RETURNING extract(epoch FROM next_request_at - localtimestamp) - :interval
+        """
+    )
+
+    def __init__(self, session_local, interval: float, stats):
+        self.session_local = session_local
+        self.interval = interval
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("GLOBAL_RATE_LIMIT_ENABLED"):
+            raise NotConfigured
+        _, session_local = create_engine_and_session(settings.get("DATABASE_URL"))
+        return cls(
+            session_local,
+            settings.getfloat("GLOBAL_REQUEST_INTERVAL", 1),
+            crawler.stats,
+        )
+
+    def _reserve(self, domain: str) -> float:
+        """枠を予約し、その枠の開始までの待ち時間(秒)を返す"""
+        with self.session_local() as session:
+            wait = session.execute(
+                self._reserve_sql, {"domain": domain, "interval": self.interval}
+            ).scalar_one()
+            session.commit()
+        return max(0.0, float(wait))
+
+    async def process_request(self, request, spider):
+        from twisted.internet import reactor
+
+        domain = urlparse(request.url).hostname or ""
+        wait = await deferred_to_future(threads.deferToThread(self._reserve, domain))
+        self.stats.inc_value("global_rate_limit/reserved")
+        if wait > 0:
+            self.stats.inc_value("global_rate_limit/wait_seconds", wait)
+            await deferred_to_future(deferLater(reactor, wait))
+        return None
@@ -1,137 +1,645 @@
+import sys
+import time
+from collections import deque
 from datetime import datetime
+from typing import Iterable
 
 from itemadapter import ItemAdapter
 from kokkai_db.database import create_engine_and_session
-from kokkai_db.schema import Meeting, Session, Speech
+from kokkai_db.invalidation import (
+    MEETINGS,
+    SESSIONS,
+    SPEECHES,
+    notify_invalidation,
+)
+from kokkai_db.partitions import ensure_session_partitions
+from kokkai_db.schema import (
+    CrawlCheckpoint,
+    CrawlShard,
+    Meeting,
+    Session,
+    Speech,
+    SpeechBody,
+)
+from sqlalchemy import and_, delete, distinct, func, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session as DbSession
+from twisted.internet import threads
+from twisted.internet.defer import Deferred, DeferredList
+from twisted.internet.task import LoopingCall
+from twisted.python.threadpool import ThreadPool
 
+from .extensions import get_crawl_metrics
+from .items import CheckpointItem, ShardItem
+from .schemas import MeetingRecord
 from .settings import DATABASE_URL
 
 
+class KnownIssueIds:
+    """
+    DBに登録済みの会議録IDの集合
+    重複チェックをDBへの問い合わせなしに行うために使う
+    """
+
+    def __init__(self, issue_ids: Iterable[str] = ()):
+        self._ids: set[str] = set(issue_ids)
+
+    def __contains__(self, issue_id: object) -> bool:
+        return issue_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, issue_id: str):
+        self._ids.add(issue_id)
+
+    def discard(self, issue_id: str):
+        self._ids.discard(issue_id)
+
+    def memory_bytes(self) -> int:
+        """集合と格納している文字列の概算メモリ使用量"""
+        return sys.getsizeof(self._ids) + sum(sys.getsizeof(i) for i in self._ids)
+
+
 class DatabasePipeline:
-    def __init__(self, session_local):
+    def __init__(
+        self,
+        session_local,
+        batch_size: int = 50,
+        flush_interval: float = 30,
+        update_changed: bool = True,
+        max_pending: int = 2,
+        stats=None,
+        crawler=None,
+    ):
         self.SessionLocal = session_local
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.update_changed = update_changed
+        self.max_pending = max_pending
+        self.stats = stats
+        self.crawler = crawler
 
     @classmethod
     def from_crawler(cls, crawler):
-        # settings = crawler.settings # settingsは不要
         database_url = DATABASE_URL
         if not database_url:
             raise ValueError("DATABASE_URL environment variable not set.")
 
-        _, session_local = create_engine_and_session(database_url)
-        return cls(session_local)
+        # 接続プールの最大使用数を統計に残す
+        _, session_local = create_engine_and_session(
+            database_url,
+            "ingest",
+            pool_stats_hook=lambda s: crawler.stats.max_value(
+                "pipeline/db_pool/max_checked_out", s["checked_out"]
+            ),
+        )
+        return cls(
+            session_local,
+            batch_size=crawler.settings.getint("DB_BATCH_SIZE", 50),
+            flush_interval=crawler.settings.getfloat("DB_FLUSH_INTERVAL", 30),
+            update_changed=crawler.settings.getbool("DB_UPDATE_CHANGED_SPEECHES", True),
+            max_pending=crawler.settings.getint("DB_WRITER_MAX_PENDING", 2),
+            stats=crawler.stats,
+            crawler=crawler,
+        )
 
     def open_spider(self, spider):
         self.session: DbSession = self.SessionLocal()
+        self.metrics = get_crawl_metrics(self.crawler)
+        # 未コミットの会議・発言 (issueIDをキーにして重複を除く)
+        self.meeting_buffer: dict[str, dict] = {}
+        self.speech_buffer: list[dict] = []
+        # 登録済みの会議の発言 (updateTimeを比較して更新分だけ書き込む)
+        self.update_buffer: dict[str, list[dict]] = {}
+        # 検索条件ごとの最新のページング位置 (会議と同じトランザクションで書き込む)
+        self.checkpoint_buffer: dict[str, dict] = {}
+        # 処理を終えた作業単位 (shard_id -> status)
+        self.shard_buffer: dict[int, str] = {}
+        self.last_flush = time.monotonic()
+        # 書き込みに失敗したバッチがあったか (書き込みスレッドでのみ読み書きする)
+        self.write_failed = False
 
-    def close_spider(self, spider):
-        self.session.close()
+        # DBへの書き込みはreactorを止めないよう専用スレッドで順番に実行する
+        self.writer = ThreadPool(minthreads=1, maxthreads=1, name="db-writer")
+        self.writer.start()
+        self.pending: deque[Deferred] = deque()
 
-    def process_item(self, item, spider):
-        adapter = ItemAdapter(item)
+        self.flush_loop = LoopingCall(self._flush_if_due, spider)
+        self.flush_loop.start(self.flush_interval, now=False)
 
         if spider.name == "meetings_spider":
-            self._process_meeting_item(adapter, spider)
+            d = self._submit(self._load_known_issue_ids, spider)
+            d.addCallback(self._set_known_issue_ids)
+            return d
+
+    def _set_known_issue_ids(self, known: KnownIssueIds):
+        self.known_issue_ids = known
+
+    def _submit(self, func, *args) -> Deferred:
+        """書き込みスレッドで関数を実行し、完了を待つDeferredを返す"""
+        from twisted.internet import reactor
+
+        d = threads.deferToThreadPool(reactor, self.writer, func, *args)
+        self.pending.append(d)
+
+        def _done(result):
+            self.pending.remove(d)
+            return result
+
+        d.addBoth(_done)
+        return d
+
+    def _wait_for_writer(self, item) -> Deferred | object:
+        """
+        書き込み待ちがDB_WRITER_MAX_PENDINGに達している場合は、
+        最も古い書き込みが終わるまでitemの完了を遅らせる
+        """
+        if len(self.pending) < self.max_pending:
+            return item
+        waiter = Deferred()
+        self.pending[0].addBoth(lambda _: waiter.callback(item))
+        return waiter
+
+    def _load_known_issue_ids(self, spider) -> KnownIssueIds:
+        """登録済みの会議録IDをストリーミングで読み込む"""
+        started = time.monotonic()
+        rows = self.session.execute(
+            select(Meeting.issue_id).execution_options(yield_per=10000)
+        )
+        known = KnownIssueIds(rows.scalars())
+        elapsed = time.monotonic() - started
+        memory = known.memory_bytes()
+        spider.logger.info(
+            f"Loaded {len(known)} known issueIDs in {elapsed:.2f}s ({memory} bytes)"
+        )
+        if self.stats is not None:
+            self.stats.set_value("pipeline/known_issue_ids/count", len(known))
+            self.stats.set_value("pipeline/known_issue_ids/load_seconds", elapsed)
+            self.stats.set_value("pipeline/known_issue_ids/memory_bytes", memory)
+        # yield_perで開いたトランザクションを閉じておく
+        self.session.commit()
+        return known
+
+    def close_spider(self, spider):
+        if self.flush_loop.running:
+            self.flush_loop.stop()
+        self._flush_meetings(spider)
+        d = DeferredList(list(self.pending))
+        d.addBoth(lambda _: self._submit(self.session.close))
+        d.addBoth(lambda _: self.writer.stop())
+        return d
+
+    def process_item(self, item, spider):
+        if isinstance(item, CheckpointItem):
+            self._process_checkpoint_item(ItemAdapter(item))
+        elif isinstance(item, ShardItem):
+            self.shard_buffer[item["shard_id"]] = item["status"]
+        elif spider.name == "meetings_spider":
+            self._process_meeting_item(item, spider)
         elif spider.name == "sessions_spider":
-            self._process_session_item(adapter, spider)
+            self._process_session_item(ItemAdapter(item), spider)
 
-        return item
+        return self._wait_for_writer(item)
 
-    def _process_meeting_item(self, adapter, spider):
+    def _process_meeting_item(self, record: MeetingRecord, spider):
+        issue_id = record.issueID
         # 既に同じ会議録IDが存在するかチェック
-        existing_meeting = (
-            self.session.query(Meeting)
-            .filter(Meeting.issue_id == adapter["issueID"])
-            .first()
-        )
-        if existing_meeting:
+        exists = issue_id in self.known_issue_ids
+        if exists and not self.update_changed:
             spider.logger.info(
-                f"Skipping: Meeting with issueID {adapter['issueID']} already exists."
+                f"Skipping: Meeting with issueID {issue_id} already exists."
             )
+            if self.stats is not None:
+                self.stats.inc_value("pipeline/meetings/skipped")
             return
 
-        # Meetingオブジェクトを作成
-        _date = (
-            datetime.strptime(adapter["date"], "%Y-%m-%d").date()
-            if adapter.get("date")
-            else None
+        started = time.perf_counter()
+        if exists:
+            # 登録済みの会議は、更新された発言だけを後でまとめて書き換える
+            self.update_buffer[issue_id] = self._speech_rows(record)
+        else:
+            self.known_issue_ids.add(issue_id)
+            self.meeting_buffer[issue_id] = self._meeting_row(record)
+            self.speech_buffer.extend(self._speech_rows(record))
+        if self.metrics is not None:
+            self.metrics.observe(
+                "convert",
+                time.perf_counter() - started,
+                records=len(record.speechRecord),
+            )
+
+        if len(self.meeting_buffer) + len(self.update_buffer) >= self.batch_size:
+            self._flush_meetings(spider)
+
+    def _process_checkpoint_item(self, adapter):
+        self.checkpoint_buffer[adapter["fingerprint"]] = {
+            "fingerprint": adapter["fingerprint"],
+            "params": adapter["params"],
+            "next_record_position": adapter.get("nextRecordPosition"),
+        }
+
+    def _flush_if_due(self, spider):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self._flush_meetings(spider)
+
+    @staticmethod
+    def _meeting_row(record: MeetingRecord) -> dict:
+        """
+        検証済みの会議録レコードをmeetingsのINSERTパラメータに変換する
+        発言の集計値もここで計算する
+        """
+        orders = [s.speechOrder for s in record.speechRecord]
+        return {
+            "issue_id": record.issueID,
+            "image_kind": record.imageKind,
+            "search_object": record.searchObject,
+            "session": record.session,
+            "name_of_house": record.nameOfHouse,
+            "name_of_meeting": record.nameOfMeeting,
+            "issue": record.issue,
+            "date": (
+                datetime.strptime(record.date, "%Y-%m-%d").date()
+                if record.date
+                else None
+            ),
+            "closing": record.closing,
+            "meeting_url": record.meetingURL,
+            "pdf_url": record.pdfURL,
+            "speech_count": len(record.speechRecord),
+            "total_chars": sum(len(s.speech) for s in record.speechRecord if s.speech),
+            "speaker_count": len(
+                {s.speaker for s in record.speechRecord if s.speaker is not None}
+            ),
+            "first_speech_order": min(orders, default=None),
+            "last_speech_order": max(orders, default=None),
+        }
+
+    @staticmethod
+    def _speech_rows(record: MeetingRecord) -> list[dict]:
+        """
+        検証済みの発言レコードをINSERTパラメータに変換する
+        本文(speech)は書き込み時に_split_bodiesでspeech_bodies用に分ける
+        """
+        issue_id = record.issueID
+        return [
+            {
+                "issue_id": issue_id,
+                "speech_id": s.speechID,
+                "session": record.session,
+                "speech_order": s.speechOrder,
+                "speaker": s.speaker,
+                "speaker_yomi": s.speakerYomi,
+                "speaker_group": s.speakerGroup,
+                "speaker_position": s.speakerPosition,
+                "speaker_role": s.speakerRole,
+                "speech": s.speech,
+                "start_page": s.startPage,
+                "create_time": s.createTime,
+                "update_time": s.updateTime,
+                "speech_url": s.speechURL,
+            }
+            for s in record.speechRecord
+        ]
+
+    @staticmethod
+    def _split_bodies(rows: list[dict]) -> tuple[list[dict], list[dict]]:
+        """発言のパラメータをspeechesとspeech_bodiesの分に分ける"""
+        speeches = []
+        bodies = []
+        for row in rows:
+            row = dict(row)
+            speech = row.pop("speech")
+            speeches.append(row)
+            if speech is not None:
+                bodies.append(
+                    {
+                        "speech_id": row["speech_id"],
+                        "session": row["session"],
+                        "speech": speech,
+                    }
+                )
+        return speeches, bodies
+
+    def _flush_meetings(self, spider):
+        """
+        バッファ済みの会議・発言を書き込みスレッドに渡す
+        """
+        self.last_flush = time.monotonic()
+        if (
+            not self.meeting_buffer
+            and not self.update_buffer
+            and not self.checkpoint_buffer
+            and not self.shard_buffer
+        ):
+            return
+
+        meetings = list(self.meeting_buffer.values())
+        speeches = self.speech_buffer
+        updates = self.update_buffer
+        checkpoints = list(self.checkpoint_buffer.values())
+        shards = self.shard_buffer
+        self.meeting_buffer = {}
+        self.speech_buffer = []
+        self.update_buffer = {}
+        self.checkpoint_buffer = {}
+        self.shard_buffer = {}
+
+        d = self._submit(
+            self._write_meetings, meetings, speeches, updates, checkpoints, shards
+        )
+        d.addCallbacks(
+            self._on_meetings_written,
+            self._on_meetings_failed,
+            callbackArgs=(meetings, spider),
+            errbackArgs=(meetings, updates, spider),
+        )
+
+    def _write_meetings(
+        self,
+        meetings: list[dict],
+        speeches: list[dict],
+        updates: dict[str, list[dict]],
+        checkpoints: list[dict],
+        shards: dict[int, str],
+    ) -> tuple[set[str], int, int, set[str]]:
+        """
+        会議・発言を1トランザクションでまとめて書き込む (書き込みスレッドで実行)
+        新規の会議はINSERTし、既に存在するissueID・speechIDはON CONFLICT DO NOTHINGで読み飛ばす
+        登録済みの会議は、updateTimeが更新された発言だけを書き換える
+        ページング位置・作業単位の完了も同じトランザクションで記録し、
+        書き込み済みのページから再開できるようにする
+        失敗したバッチがあった後はページング位置を進めず、完了した作業単位も失敗として記録する
+        (失敗したバッチの会議がどの検索条件・作業単位のものかは区別できないため、すべて止める)
+        """
+        if self.write_failed:
+            checkpoints = []
+            shards = {shard_id: "failed" for shard_id in shards}
+        started = time.perf_counter()
+        try:
+            inserted: set[str] = set()
+            new_speeches: list[dict] = []
+            if meetings:
+                result = self.session.execute(
+                    insert(Meeting)
+                    .on_conflict_do_nothing(index_elements=[Meeting.issue_id])
+                    .returning(Meeting.issue_id),
+                    meetings,
+                )
+                inserted = set(result.scalars().all())
+                # 新規に挿入された会議の発言のみを書き込む
+                new_speeches = [s for s in speeches if s["issue_id"] in inserted]
+                if new_speeches:
+                    speech_rows, body_rows = self._split_bodies(new_speeches)
+                    # speechesは国会回次ごとのパーティションに書き込む
+                    ensure_session_partitions(
+                        self.session, {m["session"] for m in meetings}
+                    )
+                    self.session.execute(
+                        insert(Speech).on_conflict_do_nothing(
+                            index_elements=[Speech.speech_id, Speech.session]
+                        ),
+                        speech_rows,
+                    )
+                    if body_rows:
+                        self.session.execute(
+                            insert(SpeechBody).on_conflict_do_nothing(
+                                index_elements=[
+                                    SpeechBody.speech_id,
+                                    SpeechBody.session,
+                                ]
+                            ),
+                            body_rows,
+                        )
+            changed_speeches, changed_meetings = self._upsert_changed_speeches(updates)
+            # 新規・訂正のあった会議をAPIのキャッシュから取り除く (コミット時に通知される)
+            notify_invalidation(self.session, MEETINGS, inserted | changed_meetings)
+            notify_invalidation(self.session, SPEECHES, inserted | changed_meetings)
+            self._write_checkpoints(checkpoints)
+            self._write_shards(shards)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            self.write_failed = True
+            self._fail_shards(shards)
+            raise
+        if self.metrics is not None:
+            self.metrics.observe(
+                "db_commit",
+                time.perf_counter() - started,
+                records=len(new_speeches) + changed_speeches,
+            )
+        return inserted, len(new_speeches), changed_speeches, changed_meetings
+
+    def _on_meetings_written(self, result, meetings: list[dict], spider):
+        inserted, new_speeches, changed_speeches, changed_meetings = result
+        spider.logger.info(
+            f"Committed: {len(inserted)} meetings, {new_speeches} speeches "
+            f"(skipped {len(meetings) - len(inserted)} existing meetings), "
+            f"updated {changed_speeches} speeches in {len(changed_meetings)} meetings"
         )
+        if self.stats is not None:
+            self.stats.inc_value("pipeline/speeches/updated", changed_speeches)
+            self.stats.inc_value(
+                "pipeline/meetings/marked_stale", len(changed_meetings)
+            )
 
-        new_meeting = Meeting(
-            issue_id=adapter.get("issueID"),
-            image_kind=adapter.get("imageKind"),
-            search_object=adapter.get("searchObject"),
-            session=adapter.get("session"),
-            name_of_house=adapter.get("nameOfHouse"),
-            name_of_meeting=adapter.get("nameOfMeeting"),
-            issue=adapter.get("issue"),
-            date=_date,
-            closing=adapter.get("closing"),
-            meeting_url=adapter.get("meetingURL"),
-            pdf_url=adapter.get("pdfURL"),
+    def _on_meetings_failed(
+        self, failure, meetings: list[dict], updates: dict[str, list[dict]], spider
+    ):
+        spider.logger.error(
+            f"Database commit failed for {len(meetings) + len(updates)} "
+            f"buffered meetings: {failure.value}"
         )
+        spider.logger.error(
+            "Crawl checkpoints will not advance and finished shards will be marked "
+            "failed for the rest of this crawl; resume restarts from the last "
+            "checkpoint written before the failure."
+        )
+        if self.stats is not None:
+            self.stats.inc_value("pipeline/write_errors")
+        # 書き込めなかった会議は未登録扱いに戻す
+        for meeting in meetings:
+            self.known_issue_ids.discard(meeting["issue_id"])
 
-        # 関連するSpeechオブジェクトを作成し、Meetingに追加
-        for speech_item in adapter.get("speechRecord", []):
-            speech_adapter = ItemAdapter(speech_item)
-            new_speech = Speech(
-                speech_id=speech_adapter.get("speechID"),
-                speech_order=speech_adapter.get("speechOrder"),
-                speaker=speech_adapter.get("speaker"),
-                speaker_yomi=speech_adapter.get("speakerYomi"),
-                speaker_group=speech_adapter.get("speakerGroup"),
-                speaker_position=speech_adapter.get("speakerPosition"),
-                speaker_role=speech_adapter.get("speakerRole"),
-                speech=speech_adapter.get("speech"),
-                start_page=speech_adapter.get("startPage"),
-                create_time=speech_adapter.get("createTime"),
-                update_time=speech_adapter.get("updateTime"),
-                speech_url=speech_adapter.get("speechURL"),
+    def _write_checkpoints(self, checkpoints: list[dict]):
+        """ページング位置を更新し、最終ページまで取得した検索条件は削除する"""
+        now = datetime.now()
+        for checkpoint in checkpoints:
+            if checkpoint["next_record_position"] is None:
+                self.session.execute(
+                    delete(CrawlCheckpoint).where(
+                        CrawlCheckpoint.fingerprint == checkpoint["fingerprint"]
+                    )
+                )
+                continue
+            stmt = insert(CrawlCheckpoint).values(**checkpoint, update_time=now)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CrawlCheckpoint.fingerprint],
+                set_={
+                    "params": stmt.excluded.params,
+                    "next_record_position": stmt.excluded.next_record_position,
+                    "update_time": stmt.excluded.update_time,
+                },
             )
-            new_meeting.speeches.append(new_speech)
+            self.session.execute(stmt)
 
+    def _write_shards(self, shards: dict[int, str]):
+        now = datetime.now()
+        for shard_id, status in shards.items():
+            self.session.execute(
+                update(CrawlShard)
+                .where(CrawlShard.shard_id == shard_id)
+                .values(status=status, finished_at=now)
+            )
+
+    def _fail_shards(self, shards: dict[int, str]):
+        """書き込めなかったバッチで完了した作業単位を、再試行されるよう失敗として記録する"""
+        if not shards:
+            return
         try:
-            self.session.add(new_meeting)
+            self._write_shards({shard_id: "failed" for shard_id in shards})
             self.session.commit()
-            spider.logger.info(f"Committed: Meeting with issueID {adapter['issueID']}")
-        except Exception as e:
-            spider.logger.error(
-                f"Database commit failed for issueID {adapter['issueID']}: {e}"
-            )
+        except Exception:
+            # 記録できなくても、取得中のまま放置された作業単位として後で取り直される
             self.session.rollback()
-            raise
+
+    def _upsert_changed_speeches(
+        self, updates: dict[str, list[dict]]
+    ) -> tuple[int, set[str]]:
+        """
+        登録済みの発言とupdateTimeを比較し、新しくなった発言と追加された発言だけをUPSERTする
+        変更があった会議は要約の作り直しが必要としてsummary_staleを立てる
+        """
+        if not updates:
+            return 0, set()
+
+        stored = dict(
+            self.session.execute(
+                select(Speech.speech_id, Speech.update_time).where(
+                    Speech.issue_id.in_(updates.keys())
+                )
+            ).all()
+        )
+
+        changed: list[dict] = []
+        for rows in updates.values():
+            for row in rows:
+                speech_id = row["speech_id"]
+                if speech_id not in stored:
+                    changed.append(row)
+                    continue
+                incoming = row["update_time"]
+                current = stored[speech_id]
+                if incoming and (
+                    current is None or datetime.fromisoformat(incoming) > current
+                ):
+                    changed.append(row)
+
+        if not changed:
+            return 0, set()
+
+        speech_rows, body_rows = self._split_bodies(changed)
+        stmt = insert(Speech)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Speech.speech_id, Speech.session],
+            set_={
+                column.name: stmt.excluded[column.name]
+                for column in Speech.__table__.columns
+                if column.name not in ("speech_id", "session")
+            },
+        )
+        self.session.execute(stmt, speech_rows)
+        if body_rows:
+            body_stmt = insert(SpeechBody)
+            body_stmt = body_stmt.on_conflict_do_update(
+                index_elements=[SpeechBody.speech_id, SpeechBody.session],
+                set_={"speech": body_stmt.excluded.speech},
+            )
+            self.session.execute(body_stmt, body_rows)
+
+        changed_meetings = {row["issue_id"] for row in changed}
+        # 発言の集計値を書き換え後の発言から計算し直す
+        aggregates = (
+            select(
+                Speech.issue_id,
+                func.count().label("speech_count"),
+                func.coalesce(func.sum(func.length(SpeechBody.speech)), 0).label(
+                    "total_chars"
+                ),
+                func.count(distinct(Speech.speaker)).label("speaker_count"),
+                func.min(Speech.speech_order).label("first_speech_order"),
+                func.max(Speech.speech_order).label("last_speech_order"),
+            )
+            .outerjoin(
+                SpeechBody,
+                and_(
+                    Speech.speech_id == SpeechBody.speech_id,
+                    Speech.session == SpeechBody.session,
+                ),
+            )
+            .where(Speech.issue_id.in_(changed_meetings))
+            .group_by(Speech.issue_id)
+            .subquery()
+        )
+        self.session.execute(
+            update(Meeting)
+            .where(Meeting.issue_id == aggregates.c.issue_id)
+            .values(
+                summary_stale=True,
+                speech_count=aggregates.c.speech_count,
+                total_chars=aggregates.c.total_chars,
+                speaker_count=aggregates.c.speaker_count,
+                first_speech_order=aggregates.c.first_speech_order,
+                last_speech_order=aggregates.c.last_speech_order,
+            )
+        )
+        return len(changed), changed_meetings
 
     def _process_session_item(self, adapter, spider):
+        d = self._submit(self._write_session, adapter.asdict(), spider)
+        d.addErrback(self._on_session_failed, adapter["session"], spider)
+
+    def _write_session(self, values: dict, spider):
+        """国会回次を登録・更新する (書き込みスレッドで実行)"""
         # 既存のセッションを検索
         existing_session = (
             self.session.query(Session)
-            .filter(Session.session == adapter["session"])
+            .filter(Session.session == values["session"])
             .first()
         )
 
         if existing_session:
             # レコードが存在する場合は更新
-            existing_session.name = adapter.get("name")
-            existing_session.start_date = adapter.get("start_date")
-            existing_session.end_date = adapter.get("end_date")
-            spider.logger.info(f"Updated: Session {adapter['session']}")
+            existing_session.name = values.get("name")
+            existing_session.start_date = values.get("start_date")
+            existing_session.end_date = values.get("end_date")
+            spider.logger.info(f"Updated: Session {values['session']}")
         else:
             # レコードが存在しない場合は新規作成
             new_session = Session(
-                session=adapter.get("session"),
-                name=adapter.get("name"),
-                start_date=adapter.get("start_date"),
-                end_date=adapter.get("end_date"),
+                session=values.get("session"),
+                name=values.get("name"),
+                start_date=values.get("start_date"),
+                end_date=values.get("end_date"),
             )
             self.session.add(new_session)
-            spider.logger.info(f"Staged for commit: Session {adapter['session']}")
+            spider.logger.info(f"Staged for commit: Session {values['session']}")
 
         try:
+            # 新しい国会回次の発言を書き込めるようパーティションを用意する
+            created = ensure_session_partitions(self.session, [values["session"]])
+            if created:
+                spider.logger.info(f"Created partitions: {', '.join(created)}")
+            notify_invalidation(self.session, SESSIONS, [values["session"]])
             self.session.commit()
-        except Exception as e:
-            spider.logger.error(
-                f"Database commit failed for session {adapter['session']}: {e}"
-            )
+        except Exception:
             self.session.rollback()
             raise
+
+    def _on_session_failed(self, failure, session_number: int, spider):
+        spider.logger.error(
+            f"Database commit failed for session {session_number}: {failure.value}"
+        )
+        if self.stats is not None:
+            self.stats.inc_value("pipeline/write_errors")
@@ -117,3 +117,20 @@ class NdlApiResponse(BaseModel):
     startRecord: int = Field(..., description="開始位置")
     nextRecordPosition: Optional[int] = Field(None, description="次開始位置")
     meetingRecord: List[MeetingRecord] = Field(..., description="会議録リスト")
+
+
+class MeetingHeader(BaseModel):
+    """meeting_list APIの会議録レコードのうち差分検出に使う項目"""
+
+    issueID: str = Field(..., description="会議録ID")
+    session: int = Field(..., description="国会回次")
+    nameOfHouse: str = Field(..., description="院名")
+    date: Optional[str] = Field(None, description="開催日付")
+
+
+class NdlMeetingListResponse(BaseModel):
+    numberOfRecords: int = Field(..., description="総結果件数")
+    numberOfReturn: int = Field(..., description="返戻件数")
+    startRecord: int = Field(..., description="開始位置")
+    nextRecordPosition: Optional[int] = Field(None, description="次開始位置")
+    meetingRecord: List[MeetingHeader] = Field(..., description="会議録リスト")
@@ -18,6 +18,7 @@ BOT_NAME = "scraper"
 
 SPIDER_MODULES = ["scraper.spiders"]
 NEWSPIDER_MODULE = "scraper.spiders"
+COMMANDS_MODULE = "scraper.commands"
 
 ADDONS = {}
 
@@ -47,21 +48,66 @@ DOWNLOAD_DELAY = 1
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-# SPIDER_MIDDLEWARES = {
-#    "scraper.middlewares.ScraperSpiderMiddleware": 543,
-# }
+SPIDER_MIDDLEWARES = {
+    "scraper.middlewares.StageMetricsSpiderMiddleware": 543,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-#    "scraper.middlewares.ScraperDownloaderMiddleware": 543,
-# }
+DOWNLOADER_MIDDLEWARES = {
+    # HttpCompressionMiddleware(590)で展開された後の本文を保存する
+    "scraper.middlewares.ResponseArchiveMiddleware": 580,
+    # 再生したレスポンスは待たせないようResponseArchiveMiddlewareの後に置く
+    "scraper.middlewares.GlobalRateLimitMiddleware": 585,
+    # RetryMiddleware(550)が再試行に回す前に429/503を確認する
+    "scraper.middlewares.AdaptiveDelayMiddleware": 600,
+    # 転送された(展開前の)バイト数を計測するためダウンローダーの近くに置く
+    "scraper.middlewares.StageMetricsDownloaderMiddleware": 950,
+}
+
+# 応答状況に応じたダウンロード間隔の調整
+# DOWNLOAD_DELAYを初期値として、ADAPTIVE_DELAY_MIN〜ADAPTIVE_DELAY_MAX秒の範囲で変化させる
+# 応答が速い間はDOWNLOAD_DELAYより短い間隔まで詰め、429/503等が返れば広げる
+ADAPTIVE_DELAY_ENABLED = True
+ADAPTIVE_DELAY_MIN = 0.25
+ADAPTIVE_DELAY_MAX = 60
+ADAPTIVE_DELAY_BACKOFF = 2
+ADAPTIVE_DELAY_LATENCY_FACTOR = 1
+ADAPTIVE_DELAY_THROTTLE_CODES = [429, 500, 502, 503, 504]
+
+# 複数プロセスでクロールする場合の、DBを介した全体のリクエスト間隔 (秒)
+# 例: scrapy crawl meetings_spider -a plan=backfill -s GLOBAL_RATE_LIMIT_ENABLED=True
+GLOBAL_RATE_LIMIT_ENABLED = False
+GLOBAL_REQUEST_INTERVAL = 1
+
+# 差分クロール(-a incremental=true)で、前回到達した開催日付から何日さかのぼって検索するか
+# NDLは開催日付より遅れて会議録を公開することがあるため、その分を取り直す
+INCREMENTAL_LOOKBACK_DAYS = 30
+
+# scrapy plan_shardsで登録した作業単位の取得設定
+# 取得中のまま CRAWL_SHARD_CLAIM_TIMEOUT 秒経過した作業単位は他のプロセスが取り直す
+# 失敗した作業単位は CRAWL_SHARD_MAX_ATTEMPTS 回まで再試行する
+CRAWL_SHARD_CLAIM_TIMEOUT = 6 * 60 * 60
+CRAWL_SHARD_MAX_ATTEMPTS = 3
+
+# APIレスポンスのローカル保存・再生
+# "record"で保存、"replay"で保存済みのレスポンスのみを使ってクロールする
+# 例: scrapy crawl meetings_spider -s RESPONSE_ARCHIVE_MODE=replay
+RESPONSE_ARCHIVE_MODE = os.environ.get("RESPONSE_ARCHIVE_MODE")
+RESPONSE_ARCHIVE_DIR = os.environ.get("RESPONSE_ARCHIVE_DIR", "archive")
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-# }
+EXTENSIONS = {
+    "scraper.extensions.CrawlMetrics": 500,
+}
+
+# 処理段階ごとの計測 (download/validate/parse/convert/db_commit)
+# CRAWL_METRICS_INTERVAL秒ごとにPrometheusのtextfile形式で、終了時にJSONで書き出す
+CRAWL_METRICS_ENABLED = True
+CRAWL_METRICS_PROMETHEUS_FILE = os.environ.get("CRAWL_METRICS_PROMETHEUS_FILE")
+CRAWL_METRICS_JSON_FILE = os.environ.get("CRAWL_METRICS_JSON_FILE")
+CRAWL_METRICS_INTERVAL = 60
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -69,6 +115,18 @@ ITEM_PIPELINES = {
     "scraper.pipelines.DatabasePipeline": 300,
 }
 
+# DatabasePipelineの書き込みバッファ設定
+# 会議をDB_BATCH_SIZE件ためるか、前回の書き込みからDB_FLUSH_INTERVAL秒経過したら
+# 1トランザクションでまとめて書き込む (書き込みは専用スレッドで行う)
+DB_BATCH_SIZE = 50
+DB_FLUSH_INTERVAL = 30
+# 登録済みの会議を再取得した場合に、updateTimeが新しくなった発言を書き換えるか
+# 書き換えた会議にはsummary_staleを立て、要約を作り直させる
+DB_UPDATE_CHANGED_SPEECHES = True
+# 書き込みスレッドに渡した未完了のバッチがこの数に達すると、
+# 書き込みが追いつくまで新しいItemの処理を待たせる
+DB_WRITER_MAX_PENDING = 2
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 # AUTOTHROTTLE_ENABLED = True
@@ -1,20 +1,69 @@
+import hashlib
+import json
+import os
+import socket
+import time
+from datetime import date, datetime, timedelta
 from urllib.parse import urlencode
 
 import scrapy
+from kokkai_db.database import create_engine_and_session
+from kokkai_db.schema import CrawlCheckpoint, CrawlShard, CrawlWatermark, Meeting
 from pydantic import ValidationError
 from scrapy.exceptions import CloseSpider
+from scrapy.utils.defer import deferred_to_future
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from twisted.internet import threads
 
-from scraper.items import MeetingItem, SpeechItem
-from scraper.schemas import NdlApiResponse, SpeechRequestParams
+from scraper.extensions import get_crawl_metrics
+from scraper.items import CheckpointItem, ShardItem
+from scraper.schemas import (
+    NdlApiResponse,
+    NdlMeetingListResponse,
+    SpeechRequestParams,
+)
+from scraper.settings import DATABASE_URL
+
+# 差分クロールの到達点を更新してよい検索条件 (これ以外を指定した場合は範囲が絞られている)
+_UNFILTERED_FIELDS = {"nameOfHouse", "maximumRecords", "recordPacking"}
+
+
+def _to_bool(value) -> bool:
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def query_fingerprint(params: SpeechRequestParams) -> str:
+    """ページング位置を除いた検索条件を識別するハッシュ"""
+    query = params.model_dump(
+        by_alias=True, exclude_none=True, exclude={"startRecord"}, mode="json"
+    )
+    return hashlib.sha1(
+        json.dumps(query, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
 
 
 class MeetingsSpider(scrapy.Spider):
     name = "meetings_spider"
     allowed_domains = ["kokkai.ndl.go.jp"]
     base_url = "https://kokkai.ndl.go.jp/api/meeting?"
+    list_url = "https://kokkai.ndl.go.jp/api/meeting_list?"
+    # meeting_list APIで1回に取得できる最大件数
+    list_page_size = 100
 
-    def __init__(self, **kwargs):
+    def __init__(
+        self, list_first=False, incremental=False, resume=True, plan=None, **kwargs
+    ):
         super().__init__(**kwargs)
+        # list_first: meeting_listで会議録IDを先に集め、未登録の会議録だけ本文を取得する
+        self.list_first = _to_bool(list_first)
+        # incremental: 前回成功時の到達点(crawl_watermarks)から検索条件を決める
+        self.incremental = _to_bool(incremental)
+        # resume: 前回中断した同じ検索条件のクロールを、最後に書き込まれたページの次から再開する
+        self.resume = _to_bool(resume)
+        # plan: scrapy plan_shardsで作成した作業単位(crawl_shards)を順に取得して処理する
+        self.plan = plan
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
         try:
             # スパイダー引数をPydanticモデルで検証
             self.request_params = SpeechRequestParams(**kwargs)
@@ -23,45 +72,382 @@ class MeetingsSpider(scrapy.Spider):
             # エラーが発生した場合、スパイダーを停止させる
             raise CloseSpider(reason=f"Invalid spider arguments: {e}")
 
-    async def start(self):
+        _, self.SessionLocal = create_engine_and_session(DATABASE_URL)
+
+        # 今回のクロールで観測した最新の開催日付・回次・更新日時
+        self.max_date: date | None = None
+        self.max_session: int | None = None
+        self.max_update_time: datetime | None = None
+        # 院以外の条件で範囲を絞ったクロールでは到達点を更新しない
+        # (絞り込みで除外した会議録を、次回の差分クロールで取りこぼさないようにする)
+        self.filtered = (
+            bool(self.request_params.model_fields_set - _UNFILTERED_FIELDS)
+            or self.plan is not None
+        )
+        if self.incremental and self.request_params.nameOfHouse is None:
+            raise CloseSpider(reason="incremental mode requires nameOfHouse")
+
+    async def _in_thread(self, func, *args):
+        """
+        DBへの問い合わせをスレッドで実行する
+        リアクタのスレッドで同期的に待つと、その間すべてのダウンロードが止まるため
+        """
+        return await deferred_to_future(threads.deferToThread(func, *args))
+
+    def _get(self, model, key):
+        with self.SessionLocal() as session:
+            return session.get(model, key)
+
+    async def _resume_params(self, params: SpeechRequestParams) -> SpeechRequestParams:
+        """保存済みのページング位置があればstartRecordに反映する"""
+        if not self.resume or "startRecord" in params.model_fields_set:
+            # 明示的に指定された開始位置を優先する
+            return params
+        fingerprint = query_fingerprint(params)
+        checkpoint = await self._in_thread(self._get, CrawlCheckpoint, fingerprint)
+        if checkpoint is None:
+            return params
+        self.logger.info(
+            f"Resuming from checkpoint {fingerprint}: "
+            f"startRecord={checkpoint.next_record_position}"
+        )
+        return params.model_copy(
+            update={"startRecord": checkpoint.next_record_position}
+        )
+
+    def _claim_shard(self) -> tuple[int, SpeechRequestParams] | None:
+        """
+        未処理の作業単位を1件取得する
+        失敗したもの(試行回数が上限未満)と、担当プロセスが止まったまま
+        CRAWL_SHARD_CLAIM_TIMEOUT秒経過したものも再取得の対象にする
+        (_in_threadで呼び出す)
+        """
+        now = datetime.now()
+        stale = now - timedelta(
+            seconds=self.settings.getfloat("CRAWL_SHARD_CLAIM_TIMEOUT", 6 * 60 * 60)
+        )
+        max_attempts = self.settings.getint("CRAWL_SHARD_MAX_ATTEMPTS", 3)
+        # 他のプロセスが取得中の行はSKIP LOCKEDで飛ばす
+        candidate = (
+            select(CrawlShard.shard_id)
+            .where(
+                CrawlShard.plan == self.plan,
+                or_(
+                    CrawlShard.status == "pending",
+                    and_(
+                        CrawlShard.status == "failed",
+                        CrawlShard.attempts < max_attempts,
+                    ),
+                    and_(
+                        CrawlShard.status == "claimed",
+                        CrawlShard.claimed_at < stale,
+                    ),
+                ),
+            )
+            .order_by(CrawlShard.shard_id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(CrawlShard)
+            .where(CrawlShard.shard_id == candidate)
+            .values(
+                status="claimed",
+                claimed_by=self.worker_id,
+                claimed_at=now,
+                attempts=CrawlShard.attempts + 1,
+            )
+            .returning(CrawlShard.shard_id, CrawlShard.params)
+            .execution_options(synchronize_session=False)
+        )
+        with self.SessionLocal() as session:
+            row = session.execute(stmt).first()
+            session.commit()
+        if row is None:
+            return None
+        return row.shard_id, SpeechRequestParams.model_validate_json(row.params)
+
+    async def _next_shard_request(self) -> scrapy.Request | None:
+        claimed = await self._in_thread(self._claim_shard)
+        if claimed is None:
+            self.logger.info(f"No shards left in plan {self.plan}.")
+            return None
+        shard_id, params = claimed
+        self.logger.info(
+            f"Claimed shard {shard_id}: "
+            f"{params.model_dump_json(by_alias=True, exclude_none=True)}"
+        )
+        self.crawler.stats.inc_value("meetings_spider/shards/claimed")
+        return self._shard_request(await self._resume_params(params), shard_id)
+
+    def _shard_request(
+        self, params: SpeechRequestParams, shard_id: int
+    ) -> scrapy.Request:
+        return scrapy.Request(
+            self._build_url(self.base_url, params),
+            self.parse,
+            cb_kwargs={"params": params, "shard_id": shard_id},
+            errback=self._on_shard_error,
+        )
+
+    async def _on_shard_error(self, failure):
+        shard_id = failure.request.cb_kwargs["shard_id"]
+        self.logger.error(f"Shard {shard_id} failed: {failure.value}")
+        async for request in self._fail_shard(shard_id):
+            yield request
+
+    def _mark_shard_failed(self, shard_id: int):
+        with self.SessionLocal() as session:
+            session.execute(
+                update(CrawlShard)
+                .where(CrawlShard.shard_id == shard_id)
+                .values(status="failed", finished_at=datetime.now())
+            )
+            session.commit()
+
+    async def _fail_shard(self, shard_id: int):
+        """作業単位を失敗として記録し、次の作業単位に進む"""
+        await self._in_thread(self._mark_shard_failed, shard_id)
+        self.crawler.stats.inc_value("meetings_spider/shards/failed")
+        request = await self._next_shard_request()
+        if request is not None:
+            yield request
+
+    def _apply_watermark(self):
+        """
+        crawl_watermarksから前回の到達点を読み込み、fromに反映する
+        NDLは開催日付より遅れて会議録を公開することがあるため、
+        到達日からINCREMENTAL_LOOKBACK_DAYS日さかのぼって検索し直す
+        (取得済みの会議録はパイプラインでupdateTimeを比較して読み飛ばす)
+        開催日付が記録されていない場合のみ回次で絞る
+        """
+        house = self.request_params.nameOfHouse
+        with self.SessionLocal() as session:
+            watermark = session.get(CrawlWatermark, house)
+        if watermark is None:
+            self.logger.info(f"No watermark for {house}; crawling full range.")
+            return
+
+        lookback = timedelta(days=self.settings.getint("INCREMENTAL_LOOKBACK_DAYS", 30))
+        update = {}
+        if self.request_params.from_ is None and watermark.last_date:
+            update["from_"] = (watermark.last_date - lookback).isoformat()
+        elif self.request_params.sessionFrom is None and watermark.last_session:
+            update["sessionFrom"] = watermark.last_session
+        self.request_params = self.request_params.model_copy(update=update)
+        self.logger.info(
+            f"Resuming {house} from watermark: date={watermark.last_date} "
+            f"(lookback {lookback.days} days), session={watermark.last_session}, "
+            f"updateTime={watermark.last_update_time}"
+        )
+
+    def _observe(self, session: int, date_str: str | None, update_times=()):
+        """到達点の更新用に開催日付・回次・更新日時の最大値を記録する"""
+        if self.max_session is None or session > self.max_session:
+            self.max_session = session
+        if date_str:
+            _date = date.fromisoformat(date_str)
+            if self.max_date is None or _date > self.max_date:
+                self.max_date = _date
+        for update_time in update_times:
+            if not update_time:
+                continue
+            _update_time = datetime.fromisoformat(update_time)
+            if self.max_update_time is None or _update_time > self.max_update_time:
+                self.max_update_time = _update_time
+
+    def closed(self, reason):
+        # パイプラインのclose_spiderで書き込みが完了した後に呼ばれる
+        if not self.incremental or reason != "finished":
+            return
+        if self.filtered:
+            self.logger.info("Crawl was narrowed by filters; watermark unchanged.")
+            return
+        stats = self.crawler.stats
+        if stats.get_value("log_count/ERROR") or stats.get_value(
+            "httperror/response_ignored_count"
+        ):
+            self.logger.warning("Crawl had errors; watermark unchanged.")
+            return
+        if self.max_date is None and self.max_session is None:
+            self.logger.info("No meetings observed; watermark unchanged.")
+            return
+
+        house = self.request_params.nameOfHouse
+        table = CrawlWatermark.__table__
+        stmt = insert(CrawlWatermark).values(
+            name_of_house=house,
+            last_date=self.max_date,
+            last_session=self.max_session,
+            last_update_time=self.max_update_time,
+            update_time=datetime.now(),
+        )
+        # 既存の到達点より後退させない
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CrawlWatermark.name_of_house],
+            set_={
+                "last_date": func.greatest(table.c.last_date, stmt.excluded.last_date),
+                "last_session": func.greatest(
+                    table.c.last_session, stmt.excluded.last_session
+                ),
+                "last_update_time": func.greatest(
+                    table.c.last_update_time, stmt.excluded.last_update_time
+                ),
+                "update_time": stmt.excluded.update_time,
+            },
+        )
+        with self.SessionLocal() as session:
+            session.execute(stmt)
+            session.commit()
+        self.logger.info(
+            f"Watermark for {house} updated: date={self.max_date}, "
+            f"session={self.max_session}, updateTime={self.max_update_time}"
+        )
+
+    def _observe_validation(self, started: float, response, records: int):
+        metrics = get_crawl_metrics(self.crawler)
+        if metrics is not None:
+            metrics.observe(
+                "validate",
+                time.perf_counter() - started,
+                records=records,
+                nbytes=len(response.body),
+            )
+
+    @staticmethod
+    def _build_url(base_url: str, params: SpeechRequestParams) -> str:
         # Pydanticモデルから辞書を生成し、Noneの値を除外
-        params = self.request_params.model_dump(
-            by_alias=True, exclude_none=True, mode="json"
+        query = params.model_dump(by_alias=True, exclude_none=True, mode="json")
+        return base_url + urlencode(query)
+
+    async def start(self):
+        if self.incremental:
+            # 設定値(self.settings)を使うため、__init__ではなくここで反映する
+            await self._in_thread(self._apply_watermark)
+        if self.plan:
+            request = await self._next_shard_request()
+            if request is not None:
+                yield request
+        elif self.list_first:
+            params = self.request_params.model_copy(
+                update={"maximumRecords": self.list_page_size}
+            )
+            yield scrapy.Request(
+                self._build_url(self.list_url, params),
+                self.parse_list,
+                cb_kwargs={"params": params},
+            )
+        else:
+            params = await self._resume_params(self.request_params)
+            yield scrapy.Request(
+                self._build_url(self.base_url, params),
+                self.parse,
+                cb_kwargs={"params": params},
+            )
+
+    def _existing_issue_ids(self, issue_ids: list[str]) -> set[str]:
+        with self.SessionLocal() as session:
+            return set(
+                session.execute(
+                    select(Meeting.issue_id).where(Meeting.issue_id.in_(issue_ids))
+                ).scalars()
+            )
+
+    async def parse_list(self, response, params: SpeechRequestParams):
+        """
+        meeting_listの結果からDB未登録の会議録IDを抽出し、本文付きの会議録を取得する
+        """
+        started = time.perf_counter()
+        try:
+            data = NdlMeetingListResponse.model_validate_json(response.body)
+        except ValidationError as e:
+            self.logger.error(f"Response validation failed: {e} URL: {response.url}")
+            return
+        self._observe_validation(started, response, len(data.meetingRecord))
+
+        for record in data.meetingRecord:
+            self._observe(record.session, record.date)
+
+        issue_ids = [record.issueID for record in data.meetingRecord]
+        existing = await self._in_thread(self._existing_issue_ids, issue_ids)
+        missing = [issue_id for issue_id in issue_ids if issue_id not in existing]
+        self.logger.info(
+            f"meeting_list: {len(missing)} new of {len(issue_ids)} meetings "
+            f"(startRecord={data.startRecord})"
         )
-        url = self.base_url + urlencode(params)
-        yield scrapy.Request(url, self.parse)
+        self.crawler.stats.inc_value("meetings_spider/list/seen", len(issue_ids))
+        self.crawler.stats.inc_value("meetings_spider/list/new", len(missing))
+
+        for issue_id in missing:
+            meeting_params = SpeechRequestParams(issueID=issue_id)
+            yield scrapy.Request(
+                self._build_url(self.base_url, meeting_params),
+                self.parse,
+                cb_kwargs={"params": meeting_params},
+            )
 
-    def parse(self, response):
+        # 次のページの処理
+        if data.nextRecordPosition:
+            next_params = params.model_copy(
+                update={"startRecord": data.nextRecordPosition}
+            )
+            yield scrapy.Request(
+                self._build_url(self.list_url, next_params),
+                self.parse_list,
+                cb_kwargs={"params": next_params},
+            )
+
+    async def parse(
+        self, response, params: SpeechRequestParams, shard_id: int | None = None
+    ):
+        started = time.perf_counter()
         try:
             # レスポンスをPydanticモデルで検証
             data = NdlApiResponse.model_validate_json(response.body)
         except ValidationError as e:
             self.logger.error(f"Response validation failed: {e} URL: {response.url}")
+            if shard_id is not None:
+                async for request in self._fail_shard(shard_id):
+                    yield request
             return
+        self._observe_validation(started, response, len(data.meetingRecord))
 
+        # 検証済みのPydanticモデルをそのままItemとしてパイプラインに渡す
         for meeting_record in data.meetingRecord:
-            meeting_item = MeetingItem()
-            # PydanticオブジェクトからItemへデータをコピー
-            for field in meeting_item.fields:
-                if hasattr(meeting_record, field):
-                    meeting_item[field] = getattr(meeting_record, field)
-
-            speeches = []
-            for speech_record in meeting_record.speechRecord:
-                speech_item = SpeechItem()
-                for field in speech_item.fields:
-                    if hasattr(speech_record, field):
-                        speech_item[field] = getattr(speech_record, field)
-                speeches.append(speech_item)
-
-            meeting_item["speechRecord"] = speeches
-            yield meeting_item
+            self._observe(
+                meeting_record.session,
+                meeting_record.date,
+                (s.updateTime for s in meeting_record.speechRecord),
+            )
+            yield meeting_record
+
+        # 検索条件全体のページングであれば、このページまで取得したことを記録する
+        # パイプラインでこのページの会議と同じトランザクションで書き込まれる
+        # (meeting_listで見つけた会議録を個別に取得する場合は記録しない)
+        if params.issueID is None:
+            yield CheckpointItem(
+                fingerprint=query_fingerprint(params),
+                params=params.model_dump_json(by_alias=True, exclude_none=True),
+                nextRecordPosition=data.nextRecordPosition,
+            )
 
         # 次のページの処理
         if data.nextRecordPosition:
-            self.request_params.startRecord = data.nextRecordPosition
-            params = self.request_params.model_dump(
-                by_alias=True, exclude_none=True, mode="json"
+            next_params = params.model_copy(
+                update={"startRecord": data.nextRecordPosition}
             )
-            url = self.base_url + urlencode(params)
-            yield scrapy.Request(url, self.parse)
+            if shard_id is not None:
+                yield self._shard_request(next_params, shard_id)
+            else:
+                yield scrapy.Request(
+                    self._build_url(self.base_url, next_params),
+                    self.parse,
+                    cb_kwargs={"params": next_params},
+                )
+        elif shard_id is not None:
+            # 作業単位の完了はこのページの会議と同じトランザクションで記録される
+            yield ShardItem(shard_id=shard_id, status="done")
+            request = await self._next_shard_request()
+            if request is not None:
+                yield request
@@ -0,0 +1,130 @@
+"""
+AdaptiveDelayMiddlewareを、429/503を返すローカルのスタブサーバーに対して動かす
+Retry-Afterが長い場合は実際に待てないため、ミドルウェアを直接呼び出して確かめる
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+import scrapy
+from scrapy.crawler import CrawlerProcess
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+
+from scraper.middlewares import AdaptiveDelayMiddleware
+
+THROTTLED = 3
+SUCCEEDED = 8
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """最初のTHROTTLED件は503/429を返し、その後は200を返す"""
+
+    requests = 0
+
+    def do_GET(self):
+        StubHandler.requests += 1
+        if StubHandler.requests <= THROTTLED:
+            if StubHandler.requests % 2:
+                self.send_response(503)
+            else:
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ProbeSpider(scrapy.Spider):
+    """1件ずつ順にリクエストし、応答ごとのダウンロード間隔を記録する"""
+
+    name = "probe"
+
+    def __init__(self, base_url: str, observed: list, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.observed = observed
+
+    async def start(self):
+        yield scrapy.Request(f"{self.base_url}/0", self.parse)
+
+    def parse(self, response):
+        delay = self.crawler.stats.get_value("adaptive_delay/current")
+        self.observed.append((response.status, delay))
+        if len(self.observed) < THROTTLED + SUCCEEDED:
+            yield scrapy.Request(f"{self.base_url}/{len(self.observed)}", self.parse)
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_backs_off_on_throttling_and_recovers(stub_server):
+    observed = []
+    process = CrawlerProcess(
+        {
+            "DOWNLOADER_MIDDLEWARES": {
+                "scraper.middlewares.AdaptiveDelayMiddleware": 600,
+            },
+            "ADAPTIVE_DELAY_ENABLED": True,
+            "ADAPTIVE_DELAY_MIN": 0.05,
+            "ADAPTIVE_DELAY_MAX": 1.0,
+            "ADAPTIVE_DELAY_BACKOFF": 2,
+            "ADAPTIVE_DELAY_LATENCY_FACTOR": 1,
+            # -s ADAPTIVE_DELAY_THROTTLE_CODES=429,503 と同じく文字列で渡す
+            "ADAPTIVE_DELAY_THROTTLE_CODES": "429,503",
+            "DOWNLOAD_DELAY": 0.2,
+            "RANDOMIZE_DOWNLOAD_DELAY": False,
+            "RETRY_ENABLED": False,
+            "HTTPERROR_ALLOW_ALL": True,
+            "ROBOTSTXT_OBEY": False,
+            "TELNETCONSOLE_ENABLED": False,
+            "LOG_LEVEL": "WARNING",
+        }
+    )
+    process.crawl(ProbeSpider, base_url=stub_server, observed=observed)
+    process.start()
+
+    assert [status for status, _ in observed] == [503, 429, 503] + [200] * SUCCEEDED
+    delays = [delay for _, delay in observed]
+
+    # 429/503のたびにADAPTIVE_DELAY_MAXまで倍々に広げる
+    assert delays[:THROTTLED] == pytest.approx([0.4, 0.8, 1.0])
+    # 正常な応答が続くと縮め、元のDOWNLOAD_DELAYより短いADAPTIVE_DELAY_MINまで戻る
+    recovery = delays[THROTTLED:]
+    assert all(b <= a for a, b in zip(recovery, recovery[1:]))
+    assert recovery[-1] == pytest.approx(0.05)
+
+
+def test_retry_after_is_kept_beyond_the_max_delay():
+    crawler = get_crawler(
+        settings_dict={"ADAPTIVE_DELAY_ENABLED": True, "ADAPTIVE_DELAY_MAX": 60}
+    )
+    middleware = AdaptiveDelayMiddleware.from_crawler(crawler)
+    slot = SimpleNamespace(delay=1.0)
+    middleware._slot = lambda request: slot
+    spider = scrapy.Spider("probe")
+    request = Request("http://127.0.0.1/0")
+
+    def throttle(status, headers=None):
+        middleware.process_response(
+            request, Response(request.url, status=status, headers=headers), spider
+        )
+        return slot.delay
+
+    # サーバーが指定した待ち時間はADAPTIVE_DELAY_MAXを超えても守る
+    assert throttle(429, {"Retry-After": "120"}) == 120
+    # 倍々に広げる分はADAPTIVE_DELAY_MAXで止める
+    assert throttle(503) == 60
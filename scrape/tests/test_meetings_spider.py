@@ -0,0 +1,113 @@
+"""
+MeetingsSpiderのDBへの問い合わせがリアクタのスレッドを止めないこと
+
+リアクタは1プロセスで1度しか起動できないため、クロールは子プロセスで実行する
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+LIST_PAGES = 2
+
+
+def meeting_list_page(start: int) -> dict:
+    return {
+        "numberOfRecords": LIST_PAGES,
+        "numberOfReturn": 1,
+        "startRecord": start,
+        "nextRecordPosition": start + 1 if start < LIST_PAGES else None,
+        "meetingRecord": [
+            {
+                "issueID": f"12170526{start}X00120250124",
+                "session": 217,
+                "nameOfHouse": "衆議院",
+                "date": "2025-01-24",
+            }
+        ],
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/api/meeting_listの結果をstartRecordごとに返す"""
+
+    def do_GET(self):
+        start = int(self.path.split("startRecord=")[1].split("&")[0])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(meeting_list_page(start)).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_crawl(server_url: str):
+    """子プロセス側: list_firstとplanのクロールを実行し、問い合わせたスレッドを出力する"""
+    from scrapy.crawler import CrawlerProcess
+
+    from scraper.spiders.meetings_spider import MeetingsSpider
+
+    calls = []
+
+    class ProbeSpider(MeetingsSpider):
+        allowed_domains = None
+        list_url = f"{server_url}/api/meeting_list?"
+        base_url = f"{server_url}/api/meeting?"
+
+        def _existing_issue_ids(self, issue_ids):
+            calls.append(("existing", threading.current_thread().name))
+            # 全件登録済みとして、本文の取得に進まない
+            return set(issue_ids)
+
+        def _claim_shard(self):
+            calls.append(("claim", threading.current_thread().name))
+            return None
+
+    process = CrawlerProcess({"LOG_LEVEL": "ERROR"})
+    process.crawl(ProbeSpider, list_first="true", startRecord=1)
+    process.crawl(ProbeSpider, plan="test")
+    process.start()
+    print(json.dumps({"main": threading.current_thread().name, "calls": calls}))
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_database_lookups_run_off_the_reactor_thread(stub_server):
+    env = {
+        **os.environ,
+        # スパイダーの読み込みにDATABASE_URLが必要だが、問い合わせは置き換えるので接続しない
+        "DATABASE_URL": "postgresql+psycopg://test@localhost/test",
+    }
+    result = subprocess.run(
+        [sys.executable, __file__, stub_server],
+        cwd=Path(__file__).parent.parent,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    output = json.loads(result.stdout.strip().splitlines()[-1])
+
+    kinds = sorted(kind for kind, _ in output["calls"])
+    assert kinds == ["claim"] + ["existing"] * LIST_PAGES
+    assert all(thread != output["main"] for _, thread in output["calls"])
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    run_crawl(sys.argv[1])
@@ -0,0 +1,42 @@
+"""
+ResponseArchiveMiddlewareがAPIのJSONのレスポンスだけを保存すること
+"""
+
+from scrapy.http import Request, Response
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+
+from scraper.middlewares import ResponseArchiveMiddleware
+
+
+def make_middleware(tmp_path):
+    stats = MemoryStatsCollector(get_crawler())
+    return ResponseArchiveMiddleware(str(tmp_path), "record", stats), stats
+
+
+def test_records_json_and_skips_other_responses(tmp_path):
+    middleware, stats = make_middleware(tmp_path)
+    api = Request("https://kokkai.ndl.go.jp/api/meeting?recordPacking=json")
+    robots = Request("https://kokkai.ndl.go.jp/robots.txt")
+
+    middleware.process_response(
+        api,
+        Response(
+            api.url,
+            headers={"Content-Type": "application/json;charset=UTF-8"},
+            body=b"{}",
+        ),
+        None,
+    )
+    middleware.process_response(
+        robots,
+        Response(robots.url, headers={"Content-Type": "text/plain"}, body=b"*"),
+        None,
+    )
+
+    api_body, _ = middleware._paths(api.url)
+    robots_body, robots_meta = middleware._paths(robots.url)
+    assert api_body.exists()
+    assert not robots_body.exists() and not robots_meta.exists()
+    assert stats.get_value("response_archive/stored") == 1
+    assert stats.get_value("response_archive/skipped") == 1
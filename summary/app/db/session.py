@@ -1,6 +1,5 @@
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from kokkai_db.database import create_async_engine_and_session
 
 from app.config import DATABASE_URL
 
-engine = create_async_engine(DATABASE_URL)
-SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine, SessionLocal = create_async_engine_and_session(DATABASE_URL, "worker")
@@ -3,8 +3,9 @@ from datetime import datetime
 from typing import List
 
 from google.genai.types import GenerateContentResponse
-from kokkai_db.schema import Meeting, Speech, Summary
-from sqlalchemy import select
+from kokkai_db.schema import LatestSummary, Meeting, Speech, SpeechBody, Summary
+from sqlalchemy import and_, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
@@ -26,8 +27,20 @@ async def make_text(issue_id: str, db: AsyncSession) -> str:
             raise Exception
 
         stmt_speeches = (
-            select(Speech.speech)
-            .where(Speech.issue_id == issue_id)
+            select(SpeechBody.speech)
+            .join(
+                Speech,
+                and_(
+                    SpeechBody.speech_id == Speech.speech_id,
+                    SpeechBody.session == Speech.session,
+                ),
+            )
+            # 会議の国会回次のパーティションだけを読む
+            .where(
+                Speech.issue_id == issue_id,
+                Speech.session == meeting.session,
+                SpeechBody.session == meeting.session,
+            )
             .order_by(Speech.speech_order)
         )
         speeches = (await db.execute(stmt_speeches)).scalars().all()
@@ -42,6 +55,17 @@ async def make_summary(issue_id: str, db: AsyncSession):
     """
     要約を作成し、DBに保存する
     """
+    # 発言の訂正による作り直し要求は、本文を読み込む前に解除してコミットしておく
+    # 要約の生成中に届いた訂正は再びsummary_staleを立てるため、次回作り直される
+    was_stale = (
+        await db.execute(
+            update(Meeting)
+            .where(Meeting.issue_id == issue_id, Meeting.summary_stale)
+            .values(summary_stale=False)
+            .returning(Meeting.issue_id)
+        )
+    ).first() is not None
+    await db.commit()
     try:
         text = await make_text(issue_id, db)
         # textを一時ファイルに保存する
@@ -57,6 +81,15 @@ async def make_summary(issue_id: str, db: AsyncSession):
         await create_summary_record(issue_id, db, response)
     except Exception as e:
         print(f"An error occurred during summary creation: {e}")
+        if was_stale:
+            # 作り直せなかったので、作り直し要求を戻す
+            await db.rollback()
+            await db.execute(
+                update(Meeting)
+                .where(Meeting.issue_id == issue_id)
+                .values(summary_stale=True)
+            )
+            await db.commit()
         raise
 
 
@@ -73,7 +106,8 @@ async def create_summary_record(
     now = datetime.now()  # 現在のタイムスタンプを取得
     prompt_version = PROMPT_VERSION
 
-    new_summary = Summary(
+    # 発言の訂正で作り直す場合は同じモデル・バージョンの要約を上書きする
+    stmt = insert(Summary).values(
         issue_id=issue_id,
         summary=cleaned_summary,
         model=MODEL,
@@ -81,8 +115,29 @@ async def create_summary_record(
         create_time=now,
         update_time=now,
     )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Summary.issue_id, Summary.model, Summary.prompt_version],
+        set_={
+            "summary": stmt.excluded.summary,
+            "update_time": stmt.excluded.update_time,
+        },
+    )
+
+    await db.execute(stmt)
 
-    db.add(new_summary)
+    # 最新の要約を指し替える (同じprompt_versionなら後から保存したものを優先)
+    latest_stmt = insert(LatestSummary).values(
+        issue_id=issue_id, model=MODEL, prompt_version=prompt_version
+    )
+    latest_stmt = latest_stmt.on_conflict_do_update(
+        index_elements=[LatestSummary.issue_id],
+        set_={
+            "model": latest_stmt.excluded.model,
+            "prompt_version": latest_stmt.excluded.prompt_version,
+        },
+        where=LatestSummary.prompt_version <= latest_stmt.excluded.prompt_version,
+    )
+    await db.execute(latest_stmt)
     print(f"Staged for commit: Summary with issueID {issue_id}")
 
 
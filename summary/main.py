@@ -2,8 +2,8 @@ import asyncio
 import time
 from datetime import datetime
 
-from kokkai_db.schema import Meeting, Speech, Summary
-from sqlalchemy import func, select
+from kokkai_db.schema import Meeting, Summary
+from sqlalchemy import func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import BATCH_SIZE, PROMPT_VERSION
@@ -11,27 +11,34 @@ from app.db.session import SessionLocal
 from app.services.summary_service import make_summary
 
 
+def meetings_to_summarize_query():
+    """未要約・古いバージョンの要約を持つ・発言が訂正された会議録を取得するSELECT文"""
+    return (
+        select(Meeting, func.max(Summary.prompt_version).label("max_version"))
+        .outerjoin(Summary, Meeting.issue_id == Summary.issue_id)
+        .where(Meeting.image_kind == "会議録", Meeting.speech_count > 0)
+        .group_by(Meeting.issue_id)
+        .having(
+            or_(
+                func.coalesce(func.max(Summary.prompt_version), 0) < PROMPT_VERSION,
+                Meeting.summary_stale,
+            )
+        )
+        .order_by(
+            func.coalesce(func.max(Summary.prompt_version), 0).asc(),
+            Meeting.session.desc(),
+            Meeting.total_chars.desc(),
+        )
+        .limit(BATCH_SIZE)
+    )
+
+
 async def run_summary_job():
     print(f"[{datetime.now()}] Starting summary job...")
     db: AsyncSession = SessionLocal()
     try:
         db.begin()
-        # 未要約または古いバージョンの要約を持つ会議録を取得
-        stmt = (
-            select(Meeting, func.max(Summary.prompt_version).label("max_version"))
-            .join(Speech, Meeting.issue_id == Speech.issue_id)
-            .outerjoin(Summary, Meeting.issue_id == Summary.issue_id)
-            .where(Meeting.image_kind == "会議録")
-            .group_by(Meeting.issue_id)
-            .having(func.coalesce(func.max(Summary.prompt_version), 0) < PROMPT_VERSION)
-            .order_by(
-                func.coalesce(func.max(Summary.prompt_version), 0).asc(),
-                Meeting.session.desc(),
-                func.sum(func.length(Speech.speech)).desc(),
-            )
-            .limit(BATCH_SIZE)
-        )
-        meetings_to_summarize = (await db.execute(stmt)).all()
+        meetings_to_summarize = (await db.execute(meetings_to_summarize_query())).all()
 
         if not meetings_to_summarize:
             print("No new meetings to summarize.")
@@ -0,0 +1,79 @@
+"""
+要約ジョブが要約対象の会議を選ぶクエリで、summariesを本文ごと走査しないことをEXPLAINで確かめる
+TEST_DATABASE_URLに空のテスト用DBを指定した場合だけ実行する
+
+本番に近い計画になるよう、専用のスキーマにコミットしてVACUUM ANALYZEし、最後にスキーマごと削除する
+"""
+
+import os
+
+import pytest
+from kokkai_db.explain import explain, seq_scanned_tables, used_indexes
+from kokkai_db.schema import Base
+from sqlalchemy import create_engine, text
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set"
+)
+
+# app.configは読み込み時に設定を必要とする (接続・APIの呼び出しはしない)
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("DATABASE_URL", TEST_DATABASE_URL or "postgresql+psycopg://")
+
+from main import meetings_to_summarize_query  # noqa: E402
+
+SCHEMA = "summary_query_plans"
+MEETINGS = 20000
+
+
+@pytest.fixture(scope="module")
+def conn():
+    engine = create_engine(
+        TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA}"}
+    )
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        Base.metadata.create_all(conn)
+        conn.execute(
+            text(
+                "INSERT INTO meetings (issue_id, image_kind, search_object, session, "
+                "name_of_house, name_of_meeting, issue, meeting_url, speech_count, "
+                "total_chars) "
+                "SELECT 'M' || i, '会議録', 0, 200 + i % 20, '衆議院', "
+                "'委員会' || (i % 50), '第1号', 'https://example.com/' || i, 10, i "
+                "FROM generate_series(1, :meetings) AS i"
+            ),
+            {"meetings": MEETINGS},
+        )
+        # 1割は未要約、残りの一部は古いバージョンの要約だけを持つ
+        conn.execute(
+            text(
+                "INSERT INTO summaries (issue_id, summary, model, prompt_version, "
+                "create_time, update_time) "
+                "SELECT 'M' || i, repeat(md5(i || '-' || v), 60), 'gemini', v, "
+                "now(), now() "
+                "FROM generate_series(1, :meetings) AS i, generate_series(1, 2) AS v "
+                "WHERE i % 10 <> 0 AND (v = 1 OR i % 3 <> 0)"
+            ),
+            {"meetings": MEETINGS},
+        )
+        conn.commit()
+        # 本番と同じく可視性マップと統計を作る (トランザクション内では実行できない)
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.execute(text("VACUUM ANALYZE"))
+        try:
+            yield conn
+        finally:
+            conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    engine.dispose()
+
+
+def test_meetings_to_summarize_read_versions_from_index(conn):
+    plan = explain(conn, meetings_to_summarize_query())
+
+    # 全会議を集計するためmeetingsは全件走査になるが、summariesは本文を読まない
+    assert "summaries" not in seq_scanned_tables(plan)
+    assert "ix_summaries_issue_id_prompt_version_update_time" in used_indexes(plan)